@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
-import os, sys, shutil, re, time, tempfile, signal, random, string, argparse
+import os, sys, shutil, re, time, tempfile, signal, random, string, argparse, threading
+import multiprocessing as mp
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 from glob import glob
 from enum import Enum, auto
@@ -14,8 +17,11 @@ from diopter.compiler import (
 from diopter.sanitizer import Sanitizer
 from diopter.utils import TempDirEnv
 import subprocess as sp
-from synthesizer.synthesizer import Synthesizer, SynthesizerError
+from synthesizer.synthesizer import Synthesizer, SynthesizerError, TAG_CHANNELS
+from databaseconstructor.functioner import SharedFunctionDB, load_function_db
 from utils.compcert import CComp as this_CComp
+from utils.resultcache import ResultCache
+from utils.pch import PCHCache
 from pathlib import Path
 from datetime import datetime
 from termcolor import colored
@@ -36,6 +42,10 @@ DEBUG = 0
 FUNCTION_DB_FILE = os.path.join(os.path.dirname(__file__), './databaseconstructor/functions_pointer_global_io.json')
 MIN_PROGRAM_SIZE = 8000 # programs shorter than this many bytes are too boring to test
 NUM_MUTANTS = 10 # number of mutants generated by the synthesizer per seed.
+MUTANT_JOBS = 4 # number of mutants differentially tested at the same time per seed.
+COMPILE_JOBS = os.cpu_count() # number of compile_and_run() running at the same time in one process.
+SEED_POOL_SIZE = 16 # max number of validated seeds waiting in the seed pool.
+SEED_WAIT_TIMEOUT = 600 # a worker generates its own seed after waiting this many seconds for the seed pool.
 COMPILER_TIMEOUT = 200
 PROG_TIMEOUT = 10
 CCOMP_TIMEOUT = 60 # compcert timeout
@@ -56,6 +66,8 @@ CC = CompilationSetting(
             )
 SAN_SAN = Sanitizer(checked_warnings=False, use_ccomp_if_available=False) # sanitizers only
 SAN_CCOMP = this_CComp.get_system_ccomp() # CompCert only
+RESULT_CACHE = None # ResultCache of compile_and_run/check_sanitizers/check_ccomp, enabled by --cache-dir
+PCH_CACHE = None # PCHCache of precompiled csmith.h headers for compile_and_run and the synthesizer, enabled by --pch-dir
 
 """Global vars"""
 
@@ -106,97 +118,242 @@ def write_bug_desc_to_file(to_file, data):
     with open(to_file, "a") as f:
         f.write(f"/* {data} */\n")
 
+BUG_DESC_RE = re.compile(r'(?:/\* (?:Compiler timeout!|Compiler crash!|EXITof |CKSMof ).* \*/\n)+\Z')
+
+def source_digest(src:str) -> str:
+    """Hash of the source file for RESULT_CACHE, ignoring the bug descriptions appended by check_compile()"""
+    with open(src, 'r') as f:
+        code = f.read()
+    return ResultCache.make_key(BUG_DESC_RE.sub('', code))
+
+def lookup_validity(src:str, key_parts:tuple, digest:str|None=None) -> bool | None:
+    """Return the cached validity of src or None if unknown"""
+    if RESULT_CACHE is None:
+        return None
+    if digest is None:
+        digest = source_digest(src)
+    cached = RESULT_CACHE.get(ResultCache.make_key(digest, *key_parts))
+    return None if cached is None else cached["valid"]
+
+def store_validity(src:str, key_parts:tuple, valid:bool, digest:str|None=None):
+    if RESULT_CACHE is None:
+        return
+    if digest is None:
+        digest = source_digest(src)
+    RESULT_CACHE.put(ResultCache.make_key(digest, *key_parts), {"valid": valid})
+
 def read_checksum(data):
     res = re.findall(r'checksum = (.*)', data)
     if len(res) > 0:
         return res[0]
     return 'NO_CKSUM'
 
-def check_sanitizers(src):
-    """Check validity with sanitizers"""
+def preprocess_program(src:str) -> SourceProgram:
+    """Preprocess the source file for validity checks"""
     with open(src, 'r') as f:
         code = f.read()
     prog = SourceProgram(code=code, language=Language.C)
-    preprog = CC.preprocess_program(prog, make_compiler_agnostic=True)
+    return CC.preprocess_program(prog, make_compiler_agnostic=True)
+
+def sanitizers_key() -> tuple:
+    return ("sanitizers", " ".join(CC.flags), ResultCache.tool_id(SAN_SAN.gcc.exe), ResultCache.tool_id(SAN_SAN.clang.exe))
+
+def check_sanitizers(src, preprog:SourceProgram|None=None):
+    """Check validity with sanitizers
+    preprog:SourceProgram -> the preprocessed src if available
+    """
+    cached = lookup_validity(src, sanitizers_key())
+    if cached is not None:
+        return cached
+    if preprog is None:
+        preprog = preprocess_program(src)
     if DEBUG:
         print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), "SAN.sanitize", flush=True)
-    if not SAN_SAN.sanitize(preprog):
-        return False
-    return True
+    valid = bool(SAN_SAN.sanitize(preprog))
+    store_validity(src, sanitizers_key(), valid)
+    return valid
+
+def run_ccomp(preprog:SourceProgram, additional_flags:list[str]=[]):
+    """Run CompCert in its own temporary directory so that several runs can be in parallel"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            return SAN_CCOMP.check_program(preprog, timeout=CCOMP_TIMEOUT, debug=DEBUG, additional_flags=additional_flags, tmp_dir=Path(tmp_dir))
+        except sp.TimeoutExpired:
+            return None
 
-def check_ccomp(src, random_count=1):
+def ccomp_key(random_count:int) -> tuple:
+    return ("ccomp", " ".join(CC.flags), random_count, CCOMP_TIMEOUT, ResultCache.tool_id(SAN_CCOMP.exe if SAN_CCOMP is not None else None))
+
+def check_ccomp(src, random_count=1, preprog:SourceProgram|None=None):
     """
     Check validity with CompCert.
     src:str -> source file
     random_count:int -> the number of times using ccomp -random for checking
+    preprog:SourceProgram -> the preprocessed src if available
+    The plain run and the -random runs are executed in parallel.
     """
-    with open(src, 'r') as f:
-        code = f.read()
-    prog = SourceProgram(code=code, language=Language.C)
-    preprog = CC.preprocess_program(prog, make_compiler_agnostic=True)
+    cached = lookup_validity(src, ccomp_key(random_count))
+    if cached is not None:
+        return cached
+    if preprog is None:
+        preprog = preprocess_program(src)
     if DEBUG:
         print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), "SAN.ccomp", flush=True)
-    with TempDirEnv():
-        try:
-            ccomp_result = SAN_CCOMP.check_program(preprog, timeout=CCOMP_TIMEOUT, debug=DEBUG)
-        except sp.TimeoutExpired:
-            return False
-        if ccomp_result is False:
-            return False
-    with TempDirEnv():
-        for _ in range(random_count):
-            try:
-                ccomp_result_random = SAN_CCOMP.check_program(preprog, timeout=CCOMP_TIMEOUT, debug=DEBUG, additional_flags=["-random"])
-            except sp.TimeoutExpired:
-                return False
-            if ccomp_result_random is False:
-                return False
-            # check for unspecified behavior
-            if ccomp_result.stdout != ccomp_result_random.stdout:
-                return False
-    return True
+    with ThreadPoolExecutor(1 + random_count) as executor:
+        future_plain = executor.submit(run_ccomp, preprog)
+        futures_random = [executor.submit(run_ccomp, preprog, ["-random"]) for _ in range(random_count)]
+        ccomp_result = future_plain.result()
+        ccomp_result_random_list = [future.result() for future in futures_random]
+    # timeouts may be caused by the load of the machine, so they are not cached
+    if ccomp_result is None or None in ccomp_result_random_list:
+        return False
+    valid = True
+    if ccomp_result is False:
+        valid = False
+    for ccomp_result_random in ccomp_result_random_list:
+        if not valid:
+            break
+        if ccomp_result_random is False:
+            valid = False
+        # check for unspecified behavior
+        elif ccomp_result.stdout != ccomp_result_random.stdout:
+            valid = False
+    store_validity(src, ccomp_key(random_count), valid)
+    return valid
+
+def check_validity(src) -> bool:
+    """Check validity with sanitizers and CompCert, preprocessing src only once"""
+    digest = source_digest(src) if RESULT_CACHE is not None else None
+    cached_san = lookup_validity(src, sanitizers_key(), digest)
+    cached_ccomp = lookup_validity(src, ccomp_key(1), digest)
+    if cached_san is False or cached_ccomp is False:
+        return False
+    if cached_san and cached_ccomp:
+        return True
+    preprog = preprocess_program(src)
+    return check_sanitizers(src, preprog) and check_ccomp(src, preprog=preprog)
 
-def compile_and_run(compiler, src):
+def compile_and_run(compiler, src, bug_desc:list|None=None, cancel:threading.Event|None=None, digest:str|None=None):
+    """
+    Compile and run src with compiler.
+    bug_desc:list -> collect the bug descriptions here instead of appending them to src
+    cancel:threading.Event -> skip the remaining work once it is set
+    digest:str -> source_digest(src) if already known
+    """
     cksum = ''
+    def report(data):
+        if bug_desc is None:
+            write_bug_desc_to_file(src, data)
+        else:
+            bug_desc.append(data)
+    if cancel is not None and cancel.is_set():
+        return CompCode.Error, cksum
+    cache_key = None
+    if RESULT_CACHE is not None:
+        if digest is None:
+            digest = source_digest(src)
+        cache_key = ResultCache.make_key(digest, "compile_and_run", compiler, ResultCache.tool_id(compiler), f"-I{CSMITH_HOME}/include", COMPILER_TIMEOUT, PROG_TIMEOUT)
+        cached = RESULT_CACHE.get(cache_key)
+        if cached is not None:
+            if cached["code"] == CompCode.Crash.name:
+                report(f"Compiler crash! Can't compile with {compiler}")
+                return CompCode.Crash, cksum
+            report(f"EXITof {compiler}: {cached['exit']}")
+            report(f"CKSMof {compiler}: {cached['cksum']}")
+            return CompCode.OK, cached["cksum"]
     tmp_f = tempfile.NamedTemporaryFile(suffix=".exe", delete=False)
     tmp_f.close()
     exe = tmp_f.name
-    cmd = f"{compiler} {src} -I{CSMITH_HOME}/include -o {exe}"
+    pch_flags = PCH_CACHE.get_flags(compiler) if PCH_CACHE is not None else []
+    cmd = f"{compiler} {' '.join(pch_flags + [src])} -I{CSMITH_HOME}/include -o {exe}"
     ret, out = run_cmd(cmd, COMPILER_TIMEOUT)
     if ret == 124: # another compile chance when timeout
         time.sleep(1)
         ret, out = run_cmd(cmd, COMPILER_TIMEOUT)
+    if ret not in [0, 124] and len(pch_flags) > 0: # make sure the precompiled header is not to blame
+        ret, out = run_cmd(f"{compiler} {src} -I{CSMITH_HOME}/include -o {exe}", COMPILER_TIMEOUT)
+        if ret == 0:
+            PCH_CACHE.disable(compiler)
     if ret == 124: # we treat timeout as crash now.
-        write_bug_desc_to_file(src, f"Compiler timeout! Can't compile with {compiler}")
+        report(f"Compiler timeout! Can't compile with {compiler}")
         if os.path.exists(exe): os.remove(exe)
         return CompCode.Timeout, cksum
     if ret != 0:
-        write_bug_desc_to_file(src, f"Compiler crash! Can't compile with {compiler}")
+        report(f"Compiler crash! Can't compile with {compiler}")
         if os.path.exists(exe): os.remove(exe)
+        if cache_key is not None:
+            RESULT_CACHE.put(cache_key, {"code": CompCode.Crash.name})
         return CompCode.Crash, cksum
+    if cancel is not None and cancel.is_set():
+        if os.path.exists(exe): os.remove(exe)
+        return CompCode.Error, cksum
     ret, out = run_cmd(f"{exe}", PROG_TIMEOUT)
     cksum = read_checksum(out)
-    write_bug_desc_to_file(src, f"EXITof {compiler}: {ret}")
-    write_bug_desc_to_file(src, f"CKSMof {compiler}: {cksum}")
+    report(f"EXITof {compiler}: {ret}")
+    report(f"CKSMof {compiler}: {cksum}")
     if os.path.exists(exe): os.remove(exe)
+    # a timeout of the program itself depends on the load of the machine
+    if cache_key is not None and ret != 124:
+        RESULT_CACHE.put(cache_key, {"code": CompCode.OK.name, "exit": ret, "cksum": cksum})
     return CompCode.OK, cksum
 
+COMPILE_POOL = None # worker pool shared by all check_compile() of this process, created on first use
+COMPILE_POOL_LOCK = threading.Lock()
+
+def get_compile_pool() -> ThreadPoolExecutor:
+    """Get the compile pool of this process.
+    It is created lazily so that forked campaign workers never inherit its threads.
+    """
+    global COMPILE_POOL
+    with COMPILE_POOL_LOCK:
+        if COMPILE_POOL is None:
+            COMPILE_POOL = ThreadPoolExecutor(COMPILE_JOBS)
+    return COMPILE_POOL
+
 def check_compile(src:str, compilers:list) -> CompCode:
-    """Compile the program with a list of compilers and check their status
+    """Compile the program with a list of compilers in parallel and check their status.
+    The remaining compilers are cancelled once the verdict is known.
     """
-    cksum_list = []
-    for comp in compilers:
+    cancel = threading.Event()
+    bug_desc_list = [[] for _ in compilers]
+    cksum_list = [None] * len(compilers)
+    verdict = None
+    digest = source_digest(src) if RESULT_CACHE is not None else None
+    pool = get_compile_pool()
+    future_to_idx = {}
+    for comp_i, comp in enumerate(compilers):
         if DEBUG:
             print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), "compiler_and_run: ", comp, flush=True)
-        ret, cksum = compile_and_run(comp, src)
+        future_to_idx[pool.submit(compile_and_run, comp, src, bug_desc_list[comp_i], cancel, digest)] = comp_i
+    for future in as_completed(future_to_idx):
+        comp_i = future_to_idx[future]
+        ret, cksum = future.result()
         if ret == CompCode.Crash:
-            return CompCode.Crash
-        if ret == CompCode.Timeout:
-            return CompCode.Timeout
-        if ret != CompCode.OK:
-            return CompCode.Error
-        cksum_list.append(cksum)
-    if len(cksum_list) != len(compilers) or len(set(cksum_list)) != 1:
+            verdict = CompCode.Crash
+        elif ret == CompCode.Timeout:
+            verdict = CompCode.Timeout
+        elif ret != CompCode.OK:
+            verdict = CompCode.Error
+        else:
+            cksum_list[comp_i] = cksum
+            # the verdict is already Wrong once two compilers of the same family disagree
+            for comp_j in range(len(compilers)):
+                if cksum_list[comp_j] is not None and compilers[comp_j].split(' ')[0] == compilers[comp_i].split(' ')[0] and cksum_list[comp_j] != cksum:
+                    verdict = CompCode.Wrong
+        if verdict is not None:
+            break
+    if verdict is not None:
+        cancel.set()
+        for future in future_to_idx:
+            future.cancel()
+    # src is only annotated after all compilers stopped reading it
+    wait(future_to_idx)
+    for bug_desc in bug_desc_list:
+        for data in bug_desc:
+            write_bug_desc_to_file(src, data)
+    if verdict is not None:
+        return verdict
+    if len(set(cksum_list)) != 1:
         maybe_WrongEval = True
         for i in range(len(compilers)):
             for j in range(i+1, len(compilers)):
@@ -207,41 +364,335 @@ def check_compile(src:str, compilers:list) -> CompCode:
         return CompCode.Wrong
     return CompCode.OK
 
-def run_one(compilers:list[str], dst_dir:Path, SYNER:Synthesizer) -> Path | None:
-    """Run compiler testing
+def check_mutants(syn_files, compilers:list[str]) -> Counter:
+    """Differentially test the mutants concurrently and count their CompCode.
+    syn_files can be a generator, each mutant is tested as soon as it is yielded.
+    Bug descriptions are appended to each mutant by check_compile().
     """
+    verdicts = Counter()
+    with ThreadPoolExecutor(MUTANT_JOBS) as executor:
+        future_to_file = {executor.submit(check_compile, syn_f, compilers): syn_f for syn_f in syn_files}
+        for future in as_completed(future_to_file):
+            ret = future.result()
+            verdicts[f'mutant_{ret.name}'] += 1
+            if ret in [CompCode.Crash, CompCode.Timeout, CompCode.Wrong]:
+                print_red(f'{ret.name}: {future_to_file[future]}')
+    return verdicts
+
+def try_generate_seed(src:str) -> str | None:
+    """Generate a csmith program as src and validate it.
+    Return None if it is a valid seed, otherwise the reason of the rejection.
+    """
+    cmd = f"{CSMITH_HOME}/bin/csmith {CSMITH_USER_OPTIONS} --output {src}"
+    ret, out = run_cmd(cmd, CSMITH_TIMEOUT)
+    if ret != 0:
+        return "generation"
+    # check size
+    if os.path.getsize(src) < MIN_PROGRAM_SIZE:
+        return "small program"
+    # check sanitization
+    if not check_validity(src):
+        return "sanitization"
+    return None
+
+class SeedPool:
+    """A bounded on-disk queue of validated csmith seeds shared by processes.
+    Producers validate candidates in tmp/ and publish them to ready/ with an atomic rename;
+    consumers claim a seed by renaming it out of ready/.
+    A producer reserves a slot of the pool before generating a candidate, so that ready/ never holds more
+    than max_size seeds however many producers run; consumers free the slot of the seed they claim.
+    Seeds left in ready/ are reused by the next campaign on the same directory.
+    """
+    REJECT_REASONS = ["generation", "small program", "sanitization"]
+
+    def __init__(self, pool_dir:Path, max_size:int=SEED_POOL_SIZE) -> None:
+        self.tmp_dir = pool_dir / 'tmp'
+        self.ready_dir = pool_dir / 'ready'
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.ready_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.slots = mp.BoundedSemaphore(max_size) # free slots of the pool, taken by the seeds in ready/ and in progress
+        for _ in range(min(self.depth(), max_size)):
+            self.slots.acquire()
+        # counters shared by all processes started after the pool is created
+        self.num_excess = mp.Value('L', max(0, self.depth() - max_size)) # seeds left by a campaign with a larger pool, without a slot
+        self.num_candidates = mp.Value('L', 0)
+        self.num_rejected = {reason: mp.Value('L', 0) for reason in SeedPool.REJECT_REASONS}
+        self.num_producers = mp.Value('i', 0) # producers started and not exited yet
+
+    def depth(self) -> int:
+        """The number of validated seeds waiting in the pool"""
+        return len(os.listdir(self.ready_dir))
+
+    def produce(self, stop:mp.Event):
+        """Keep the pool filled with validated seeds until stop is set"""
+        while not stop.is_set():
+            if not self.slots.acquire(timeout=0.5):
+                continue
+            seed_name = f'{id_generator()}_seed.c'
+            src = str((self.tmp_dir / seed_name).absolute())
+            reason = try_generate_seed(src)
+            with self.num_candidates.get_lock():
+                self.num_candidates.value += 1
+            if reason is None:
+                os.replace(src, self.ready_dir / seed_name)
+                continue
+            self.slots.release()
+            with self.num_rejected[reason].get_lock():
+                self.num_rejected[reason].value += 1
+            if os.path.exists(src):
+                os.remove(src)
+
+    def get(self, dst:str, stop:mp.Event=None, timeout:float=SEED_WAIT_TIMEOUT) -> bool:
+        """Move a validated seed to dst, waiting until one is available.
+        Return False without a seed once stop is set, all producers have exited, or timeout seconds passed.
+        """
+        deadline = time.time() + timeout
+        while True:
+            for seed_name in os.listdir(self.ready_dir):
+                try:
+                    os.rename(self.ready_dir / seed_name, dst)
+                except FileNotFoundError:
+                    continue # claimed by another consumer
+                with self.num_excess.get_lock():
+                    if self.num_excess.value > 0:
+                        self.num_excess.value -= 1
+                    else:
+                        self.slots.release()
+                return True
+            if stop is not None and stop.is_set():
+                return False
+            if self.num_producers.value <= 0 or time.time() >= deadline:
+                return False
+            time.sleep(0.2)
+
+    def stats_str(self) -> str:
+        num_candidates = self.num_candidates.value
+        num_rejected = sum(self.num_rejected[reason].value for reason in SeedPool.REJECT_REASONS)
+        rejected_str = ", ".join(f"{reason}={self.num_rejected[reason].value}" for reason in SeedPool.REJECT_REASONS)
+        return f"seed pool: {num_candidates} candidates, {num_rejected} rejected ({100*num_rejected/max(num_candidates, 1):.1f}%: {rejected_str}), queue depth {self.depth()}/{self.max_size}"
+
+def seed_producer(seed_pool:SeedPool, stop:mp.Event, config:dict):
+    """Background process filling the seed pool, with the settings of campaign_config()"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        apply_campaign_config(config)
+        seed_pool.produce(stop)
+    finally:
+        with seed_pool.num_producers.get_lock():
+            seed_pool.num_producers.value -= 1
+
+def stream_mutants(SYNER:Synthesizer, src:str, syn_files:list[str], syn_errors:list[SynthesizerError]):
+    """Save each mutant of src as soon as it is synthesized and yield its filename.
+    The filenames are also collected in syn_files.
+    A SynthesizerError ends the stream and is collected in syn_errors, so that the mutants yielded so far are still tested.
+    """
+    try:
+        for num_i, syn_src in enumerate(SYNER.synthesize_iter(src_filename=src, num_mutant=NUM_MUTANTS, DEBUG=DEBUG)):
+            syn_f = f'{os.path.splitext(src)[0]}_syn{num_i}.c'
+            with open(syn_f, "w") as f:
+                f.write(syn_src)
+            syn_files.append(syn_f)
+            yield syn_f
+    except SynthesizerError as e:
+        syn_errors.append(e)
+
+def run_one(compilers:list[str], dst_dir:Path, SYNER:Synthesizer, seed_pool:SeedPool|None=None, stop:mp.Event=None) -> Counter:
+    """Run compiler testing on one seed and its mutants.
+    The seed is taken from seed_pool if given, otherwise generated here, also when the seed pool cannot provide one.
+    Once stop is set, waiting for or generating a seed is given up and nothing is tested.
+    Return the statistics of this run, e.g., the number of seeds and mutants.
+    """
+    stats = Counter()
     save_realsmith_dir = (dst_dir)
     succ_file_id = id_generator()
     src = str((dst_dir / f'{succ_file_id}_seed.c').absolute())
-    print_blue('Generating seed...')
-    while True:
-        cmd = f"{CSMITH_HOME}/bin/csmith {CSMITH_USER_OPTIONS} --output {src}"
-        ret, out = run_cmd(cmd, CSMITH_TIMEOUT)
-        if ret != 0:
-            print("csmith failed: generation.")
-            continue
-        # check size
-        if os.path.getsize(src) < MIN_PROGRAM_SIZE:
-            print("csmith failed: small program.")
-            continue
-        # check sanitization
-        if check_sanitizers(src) and check_ccomp(src):
-            break
-        print("csmith failed: sanitization.")
+    has_seed = False
+    if seed_pool is not None:
+        print_blue('Waiting for seed...')
+        has_seed = seed_pool.get(src, stop)
+    if not has_seed and (stop is None or not stop.is_set()):
+        print_blue('Generating seed...')
+    if not has_seed:
+        while True:
+            if stop is not None and stop.is_set():
+                if os.path.exists(src):
+                    os.remove(src)
+                return stats
+            reason = try_generate_seed(src)
+            if reason is None:
+                break
+            print(f"csmith failed: {reason}.")
     print_blue(f"Seed generated: {src}")
+    stats['seeds'] += 1
     ret = check_compile(src, compilers)
-    print_blue('Synthesizing mutants...')
-    # synthesize
-    try:
-        syn_files = SYNER.synthesizer(src_filename=src, num_mutant=NUM_MUTANTS, DEBUG=DEBUG)
-    except:
+    stats[f'seed_{ret.name}'] += 1
+    print_blue('Synthesizing and testing mutants...')
+    # synthesize, each mutant is tested while the next one is being synthesized
+    syn_files, syn_errors = [], []
+    verdicts = check_mutants(stream_mutants(SYNER, src, syn_files, syn_errors), compilers)
+    stats['mutants'] += len(syn_files)
+    stats.update(verdicts)
+    if len(syn_errors) > 0:
         print('SynthesizerError!')
-        os.remove(src)
-        return 0
+        stats['synthesizer_errors'] += 1
+        # the seed is kept with the mutants synthesized before the error
+        if len(syn_files) == 0:
+            os.remove(src)
+            return stats
 
     print_green(f'Synthesizing done! Programs saved as {src.replace(".c", "_syn*.c")}')
 
-    return 0
+    return stats
+
+"""Campaign"""
+CAMPAIGN_SYNER = None # the synthesizer of this campaign worker, built by campaign_init()
+CAMPAIGN_SEED_POOL = None # the seed pool shared by all campaign workers if any
+CAMPAIGN_STOP = None # set once the campaign stops, so that workers stop waiting for seeds
+
+def campaign_config() -> dict:
+    """The settings of the main process needed by campaign processes, as plain values,
+    so that they reach the workers with any multiprocessing start method, not only fork"""
+    return {
+        "num_mutants": NUM_MUTANTS,
+        "mutant_jobs": MUTANT_JOBS,
+        "compile_jobs": COMPILE_JOBS,
+        "cache_dir": RESULT_CACHE.db_file.parent if RESULT_CACHE is not None else None,
+        "cache_bytes": RESULT_CACHE.max_bytes if RESULT_CACHE is not None else None,
+        "pch_dir": PCH_CACHE.cache_dir if PCH_CACHE is not None else None,
+    }
+
+def apply_campaign_config(config:dict):
+    """Set the settings of campaign_config() in a campaign process"""
+    global NUM_MUTANTS, MUTANT_JOBS, COMPILE_JOBS, RESULT_CACHE, PCH_CACHE
+    NUM_MUTANTS = config["num_mutants"]
+    MUTANT_JOBS = config["mutant_jobs"]
+    COMPILE_JOBS = config["compile_jobs"]
+    if config["cache_dir"] is not None:
+        RESULT_CACHE = ResultCache(config["cache_dir"], max_bytes=config["cache_bytes"])
+    if config["pch_dir"] is not None:
+        PCH_CACHE = PCHCache(config["pch_dir"], Path(CSMITH_HOME) / "include")
+
+def campaign_init(config:dict, syner_args:dict, seed_pool:SeedPool|None=None, stop:mp.Event=None):
+    """Initialize a campaign worker with the settings of campaign_config() and a Synthesizer built from syner_args"""
+    global CAMPAIGN_SYNER, CAMPAIGN_SEED_POOL, CAMPAIGN_STOP
+    # only the main process handles Ctrl-C; the ignored SIGINT is inherited by csmith and compilers
+    # so that an interrupt does not turn running compilations into false crashes.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    apply_campaign_config(config)
+    CAMPAIGN_SYNER = Synthesizer(**syner_args, pch_cache=PCH_CACHE)
+    CAMPAIGN_SEED_POOL = seed_pool
+    CAMPAIGN_STOP = stop
+
+def campaign_task(compilers:list[str], dst_dir:Path) -> Counter:
+    """Test one seed in a campaign worker"""
+    return run_one(compilers, dst_dir, CAMPAIGN_SYNER, CAMPAIGN_SEED_POOL, CAMPAIGN_STOP)
+
+def print_summary(stats:Counter, elapsed:float, seed_pool:SeedPool|None=None):
+    """Print the throughput of a campaign"""
+    hours = max(elapsed, 1e-6) / 3600
+    print_green(f"Campaign finished in {elapsed:.0f}s: "
+                f"{stats['seeds']} seeds ({stats['seeds']/hours:.1f}/hour), "
+                f"{stats['mutants']} mutants ({stats['mutants']/hours:.1f}/hour), "
+                f"{stats['synthesizer_errors']} synthesizer errors, {stats['worker_errors']} worker errors.")
+    verdicts = ", ".join(f"{code.name}={stats[f'mutant_{code.name}']}" for code in CompCode if stats[f'mutant_{code.name}'] > 0)
+    if verdicts != "":
+        print_green(f"Mutant verdicts: {verdicts}")
+    if seed_pool is not None:
+        print_green(f"Final {seed_pool.stats_str()}")
+
+def run_campaign(compilers:list[str], dst_dir:Path, syn_prob:int, num_workers:int=1, max_seeds:int=0, time_budget:int=0,
+                 num_seed_producers:int=0, seed_pool_size:int=SEED_POOL_SIZE, profile_cache_dir:str|None=None,
+                 tag_channel:str="text", profiler_server:bool=False, shared_function_db:bool=False) -> Counter:
+    """Keep num_workers processes busy with run_one() until the budget is used up.
+    max_seeds:int -> stop after this many seeds, 0 means no limit
+    time_budget:int -> stop submitting new seeds after this many seconds, 0 means no limit
+    num_seed_producers:int -> number of background processes filling a seed pool in dst_dir/.seedpool,
+                              0 means each worker generates its own seeds
+    profile_cache_dir:str -> directory to cache the profiled seeds of the synthesizer, None to disable
+    tag_channel:str -> how the profiled seeds report tag values to the synthesizer, one of TAG_CHANNELS
+    profiler_server:bool -> keep a long-lived profiler process per worker instead of starting one per seed
+    shared_function_db:bool -> publish the function database in shared memory, so that the workers read it without copies
+    The first Ctrl-C waits for the running seeds to finish, the second one aborts them.
+    """
+    stop = False
+    def handle_sigint(signum, frame):
+        nonlocal stop
+        if stop:
+            raise KeyboardInterrupt
+        print_red('Interrupted! Waiting for running seeds to finish (Ctrl-C again to abort)...')
+        stop = True
+    orig_sigint_handler = signal.signal(signal.SIGINT, handle_sigint)
+
+    config = campaign_config()
+    seed_pool, producers = None, []
+    stop_producers = mp.Event()
+    stop_workers = mp.Event() # set once no more seeds are submitted, so that workers stop waiting for seeds
+    if num_seed_producers > 0:
+        seed_pool = SeedPool(dst_dir / '.seedpool', max_size=seed_pool_size)
+        for _ in range(num_seed_producers):
+            with seed_pool.num_producers.get_lock():
+                seed_pool.num_producers.value += 1
+            producer = mp.Process(target=seed_producer, args=(seed_pool, stop_producers, config), daemon=True)
+            producer.start()
+            producers.append(producer)
+
+    # the function database is loaded once and inherited by forked workers, or pickled to spawned ones;
+    # a SharedFunctionDB is attached by name in either case.
+    # Each worker builds its own Synthesizer from these arguments, as the synthesizer keeps per-process state.
+    function_db = load_function_db(FUNCTION_DB_FILE)
+    if shared_function_db:
+        try:
+            function_db = SharedFunctionDB.publish(function_db)
+        except OSError as e:
+            print_red(f'Cannot publish the function database in shared memory, loading it normally: {e}')
+    syner_args = {"func_database": function_db, "prob": syn_prob, "profile_cache_dir": profile_cache_dir,
+                  "tag_channel": tag_channel, "profiler_server": profiler_server}
+
+    stats = Counter()
+    start_time = time.time()
+    last_report_time = start_time
+    num_submitted = 0
+    pending = []
+    with mp.Pool(num_workers, initializer=campaign_init, initargs=(config, syner_args, seed_pool, stop_workers)) as pool:
+        try:
+            while True:
+                if time_budget > 0 and time.time() - start_time >= time_budget:
+                    stop = True
+                if stop:
+                    stop_workers.set()
+                if seed_pool is not None and time.time() - last_report_time >= 60:
+                    print_blue(seed_pool.stats_str().capitalize())
+                    last_report_time = time.time()
+                # keep every worker busy with exactly one seed
+                while not stop and len(pending) < num_workers and (max_seeds == 0 or num_submitted < max_seeds):
+                    pending.append(pool.apply_async(campaign_task, (compilers, dst_dir)))
+                    num_submitted += 1
+                if len(pending) == 0:
+                    break
+                time.sleep(0.5)
+                for res in [res for res in pending if res.ready()]:
+                    pending.remove(res)
+                    try:
+                        stats.update(res.get())
+                    except Exception as e:
+                        print_red(f'Campaign worker failed: {e}')
+                        stats['worker_errors'] += 1
+        except KeyboardInterrupt:
+            print_red('Aborted!')
+            pool.terminate()
+    # seeds being validated are not needed anymore
+    stop_producers.set()
+    for producer in producers:
+        producer.terminate()
+        producer.join()
+    if seed_pool is not None:
+        shutil.rmtree(seed_pool.tmp_dir, ignore_errors=True)
+    if isinstance(function_db, SharedFunctionDB):
+        function_db.close()
+    signal.signal(signal.SIGINT, orig_sigint_handler)
+    print_summary(stats, time.time() - start_time, seed_pool)
+    return stats
 
 
 if __name__=='__main__':
@@ -249,19 +700,43 @@ if __name__=='__main__':
     parser.add_argument("--dst", required=True, type=Path, help="Destination directory for generated seeds.")
     parser.add_argument("--syn-prob", required=True, type=int, help="Synthesis probability")
     parser.add_argument("--num-mutants", required=True, type=int, help="The number of mutants per seed by realsmith")
+    parser.add_argument("--cpu", default=1, type=int, help="The number of seeds tested in parallel. (default=1)")
+    parser.add_argument("--max-seeds", default=None, type=int, help="Stop after this many seeds, 0 means no limit. (default=1, or no limit with --time-budget)")
+    parser.add_argument("--time-budget", default=0, type=int, help="Stop after this many seconds, 0 means no limit. (default=0)")
+    parser.add_argument("--mutant-jobs", default=MUTANT_JOBS, type=int, help=f"The number of mutants tested in parallel per seed. (default={MUTANT_JOBS})")
+    parser.add_argument("--compile-jobs", default=None, type=int, help="The number of compilations running in parallel per worker. (default=#ALL_CPUs/--cpu)")
+    parser.add_argument("--seed-producers", default=0, type=int, help="The number of background processes generating and validating seeds, 0 means each worker generates its own seeds. (default=0)")
+    parser.add_argument("--cache-dir", default=None, type=Path, help="Directory of a persistent cache of compilation, execution and validation results. (default=disabled)")
+    parser.add_argument("--cache-size", default=1024, type=int, help="The max size of the result cache in MB. (default=1024)")
+    parser.add_argument("--pch-dir", default=None, type=Path, help="Directory to keep precompiled csmith.h headers, one per compiler setting, used by all compilations. (default=disabled)")
+    parser.add_argument("--profile-cache-dir", default=None, type=str, help="Directory to cache the profiled seeds, so that more mutants of a known seed skip the profiler. (default=disabled)")
+    parser.add_argument("--profiler-server", action="store_true", help="Keep a long-lived profiler process per worker instead of starting the profiler for every seed.")
+    parser.add_argument("--shared-function-db", action="store_true", help="Publish the function database in shared memory once instead of keeping a copy in every worker.")
+    parser.add_argument("--tag-channel", default="text", choices=TAG_CHANNELS, help="How profiled seeds report values: printf to stdout (text) or fixed-size records written at exit (binary). (default=text)")
+    parser.add_argument("--seed-pool-size", default=SEED_POOL_SIZE, type=int, help=f"The max number of validated seeds waiting in the seed pool. (default={SEED_POOL_SIZE})")
     args = parser.parse_args()
 
     dst_dir = Path(args.dst)
     dst_dir.mkdir(parents=True, exist_ok=True)
 
     NUM_MUTANTS = args.num_mutants
+    MUTANT_JOBS = max(1, args.mutant_jobs)
+    # --cpu budgets both the workers and the compilations of each worker
+    COMPILE_JOBS = max(1, args.compile_jobs if args.compile_jobs is not None else (os.cpu_count() or 1) // max(1, args.cpu))
+    if args.cache_dir is not None:
+        RESULT_CACHE = ResultCache(args.cache_dir, max_bytes=args.cache_size * 1024 * 1024)
+    if args.pch_dir is not None:
+        PCH_CACHE = PCHCache(args.pch_dir, Path(CSMITH_HOME) / "include")
+    max_seeds = args.max_seeds
+    if max_seeds is None:
+        max_seeds = 0 if args.time_budget > 0 else 1
 
     compilers = [
         "gcc -O0",
         "clang -O0"
     ]
-    SYNER = Synthesizer(func_database=FUNCTION_DB_FILE, prob=args.syn_prob)
     with TempDirEnv() as tmp_dir:
         os.environ['TMPDIR'] = tmp_dir.absolute().as_posix()
-        total = 0
-        ret = run_one(compilers, dst_dir, SYNER)
+        run_campaign(compilers, dst_dir, args.syn_prob, num_workers=max(1, args.cpu), max_seeds=max_seeds, time_budget=args.time_budget,
+                     num_seed_producers=max(0, args.seed_producers), seed_pool_size=max(1, args.seed_pool_size), profile_cache_dir=args.profile_cache_dir,
+                     tag_channel=args.tag_channel, profiler_server=args.profiler_server, shared_function_db=args.shared_function_db)
@@ -1,5 +1,7 @@
-import re
+import re, threading
+import subprocess as sp
 from shutil import which
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from diopter.compiler import (
     CompilationSetting,
@@ -13,18 +15,31 @@ from diopter.compiler import (
 from diopter.sanitizer import Sanitizer
 from variable import *
 from functioner import *
-from proxy import generate_proxy_function, generate_closure_program
+from proxy import generate_proxy_function, generate_closure_program, generate_call, generate_batch_closure_program, merge_proxy_function
+
+MATRIX_POOL = None # worker pool shared by all IOGenerator of this process, created on first use
+MATRIX_POOL_LOCK = threading.Lock()
+
+def get_matrix_pool(matrix_jobs:int) -> ThreadPoolExecutor:
+    """Get the matrix pool of this process, with matrix_jobs threads.
+    It is created lazily so that forked workers never inherit its threads.
+    """
+    global MATRIX_POOL
+    with MATRIX_POOL_LOCK:
+        if MATRIX_POOL is None:
+            MATRIX_POOL = ThreadPoolExecutor(matrix_jobs)
+    return MATRIX_POOL
 
 
 class IOGenerator():
     """An IO generator for a C function
     """
-    def __init__(self) -> None:
+    def __init__(self, matrix_jobs:int=1) -> None:
         """Generate a valid input for the input function and return its IO pair
         Args:
-            input_func (Function): the input function
-            max_try_time (int): the max number of times we try to find a valid input
+            matrix_jobs (int): the max number of compilers running at the same time, 1 to run them one by one
         """
+        self.matrix_jobs = matrix_jobs
         self.compilers = []
         for opt in ['O0', 'O1', 'O2', 'O3', 'Os']:
             self.compilers.append(
@@ -84,6 +99,35 @@ class IOGenerator():
 
         return None, None # failed to generate a valid IO pair
 
+    def generate_batch(self, input_func:Function, num_io:int, batch_size:int, max_try_time:int=5, debug:bool=False) -> tuple[list, Optional[Function]]:
+        """Generate up to num_io valid IO pairs for the input function, compiling batch_size candidate inputs into one program
+        Args:
+            input_func (Function): the input function
+            num_io (int): the number of IO pairs wanted
+            batch_size (int): the number of candidate inputs evaluated by one program
+            max_try_time (int): the max number of batches we try for each input range;
+                an input range is given up after a batch without any valid input
+        Return:
+            list: the [input, output] pairs, empty if no valid input is found
+            Function: the function these IO pairs belong to, the same for all of them even with a proxy function
+        """
+        inp = self.get_input(input_func)
+        proxy_function = generate_proxy_function(input_func, inp)
+        io_list = []
+        # try with random input ranges, then with a small input range
+        for given_min, given_max in [(None, None), (-5, 5)]:
+            try_time = 0
+            while try_time < max_try_time and len(io_list) < num_io:
+                inps = [self.get_input(input_func, given_min=given_min, given_max=given_max) for _ in range(batch_size)]
+                outs = self.execute_batch(proxy_function, input_func, inps, debug)
+                for idx, out in sorted(outs.items()):
+                    if [inps[idx], out] not in io_list and len(io_list) < num_io:
+                        io_list.append([inps[idx], out])
+                if len(outs) == 0:
+                    break # e.g., the function fails on every input, so more batches would only repeat the splitting
+                try_time += 1
+        return io_list, merge_proxy_function(proxy_function, input_func)
+
     def get_input(self, input_func:Function, to_string=False, given_min=None, given_max=None):
         """Randomly select a valid for each input arg
         """
@@ -116,7 +160,6 @@ class IOGenerator():
             out = comp_out.output.run(timeout=5)
         except:
             raise ValidateError
-        out = comp_out.output.run(timeout=5)
         return self.parse_output(out.stdout)
 
     def check_type_sanitizer(self, program:SourceProgram) -> bool:
@@ -133,38 +176,160 @@ class IOGenerator():
             out = comp_out.output.run(timeout=5)
         except:
             return False
-        out = comp_out.output.run(timeout=5)
         if "TypeSanitizer" in out.stderr:
             return False
         return True
 
+    def run_jobs(self, jobs:list, check) -> None:
+        """
+        Run the jobs, on the matrix pool if matrix_jobs > 1, and call check(result) on their results in order.
+        A job or check that raises stops the others: the jobs that have not started are cancelled,
+        so that the outcome is the same as running them one by one.
+        The jobs that already started are waited for, so none of them is still running during the next sanitize(),
+        whose TempDirEnv changes and then removes the temporary directory of the whole process.
+        """
+        if self.matrix_jobs <= 1:
+            for job in jobs:
+                check(job())
+            return
+        pool = get_matrix_pool(self.matrix_jobs)
+        futures = [pool.submit(job) for job in jobs]
+        try:
+            for future in futures:
+                check(future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+            wait(futures)
+
+    def sanitize(self, prog:SourceProgram) -> bool:
+        """Check the program with the sanitizers and TypeSanitizer.
+        They never run in parallel with each other or with the compilers, because the sanitizers
+        switch the temporary directory of the whole process (TempDirEnv) and remove it afterwards.
+        """
+        return bool(self.sanitizer.sanitize(prog)) and self.check_type_sanitizer(prog)
+
     def execute_program(self, src:str, debug:bool=False) -> str:
         """
         Validate if the function is valid under the given input; if yes, return the output
         """
         prog = SourceProgram(code=src, language=Language.C)
-        sanitizer_ret = self.sanitizer.sanitize(prog)
-        if not sanitizer_ret:
+        # verify with the sanitizers and TypeSanitizer
+        if not self.sanitize(prog):
             raise ValidateError
-        # verify with TypeSanitizer
-        typesanitizer_ret = self.check_type_sanitizer(prog)
-        if not typesanitizer_ret:
-            raise ValidateError
-        
+
         # verify consistent outputs from all compilers
         out_list = []
-        for compiler in self.compilers:
-            out = self.compile_and_run(compiler, prog)
-            if out_list != []:
-                if out_list[0] != out:
-                    raise InconsistentOutputError
+        def check(out):
+            if out_list != [] and out_list[0] != out:
+                raise InconsistentOutputError
             out_list.append(out)
-        if len(set(out_list)) != 1:
-            raise InconsistentOutputError
+        self.run_jobs([lambda compiler=compiler: self.compile_and_run(compiler, prog) for compiler in self.compilers], check)
         out = out_list[0]
 
         return out
     
+    def sanitize_batch(self, proxy_function:Function, input_func:Function, batch_calls:list, indices:list[int], budget:list[int], known_invalid:bool=False) -> list[list[int]]:
+        """
+        The indices of batch_calls whose inputs pass the sanitizers, grouped by the program that passed, in order.
+        All inputs are checked in one program; a failing program is split in halves until the invalid inputs are isolated.
+        budget[0] is the number of sanitizer runs left; once it is used up, the inputs that are not checked yet are dropped,
+        so that a function failing on most inputs costs a few runs instead of a full binary tree of them.
+        known_invalid skips the check of a program that must fail because the other half of a failing program passed.
+        """
+        if not known_invalid:
+            if budget[0] <= 0:
+                return []
+            budget[0] -= 1
+            src = generate_batch_closure_program(proxy_function, input_func, [batch_calls[i] for i in indices])
+            prog = SourceProgram(code=src, language=Language.C)
+            if self.sanitize(prog):
+                return [indices]
+        if len(indices) == 1:
+            return []
+        mid = len(indices) // 2
+        left = self.sanitize_batch(proxy_function, input_func, batch_calls, indices[:mid], budget)
+        return left + self.sanitize_batch(proxy_function, input_func, batch_calls, indices[mid:], budget, known_invalid=left == [indices[:mid]])
+
+    def execute_batch(self, proxy_function:Function, input_func:Function, inps:list[list[str]], debug:bool=False) -> dict[int, str]:
+        """
+        Validate the inputs in one batch program; return the outputs of the valid ones by their index in inps.
+        The sanitizers check the whole batch plus at most 2*ceil(log2(len(inps))) split programs.
+        If the valid inputs passed in several split programs, the program combining them is checked as well,
+        as it is the one the compilers run; if it fails, only the largest split program that passed is kept.
+        Each compiler builds the program once and runs each input in its own process, so an input that
+        crashes or times out only invalidates itself. Like execute_program(), the compilers run on the
+        matrix pool and inconsistent outputs across compilers raise InconsistentOutputError.
+        """
+        batch_calls = [generate_call(proxy_function, input_func, inp) for inp in inps]
+        budget = [1 + 2 * max(1, (len(batch_calls) - 1).bit_length())]
+        groups = self.sanitize_batch(proxy_function, input_func, batch_calls, list(range(len(batch_calls))), budget)
+        if len(groups) == 0:
+            return {}
+        valid = [idx for group in groups for idx in group]
+        src = generate_batch_closure_program(proxy_function, input_func, [batch_calls[i] for i in valid])
+        prog = SourceProgram(code=src, language=Language.C)
+        if len(groups) > 1 and not self.sanitize(prog):
+            valid = max(groups, key=len)
+            src = generate_batch_closure_program(proxy_function, input_func, [batch_calls[i] for i in valid])
+            prog = SourceProgram(code=src, language=Language.C)
+        if debug:
+            with open('debug.c', 'w') as f:
+                f.write(src)
+
+        def compile_and_run_batch(compiler:CompilationSetting) -> tuple[list[tuple[bool, Optional[str]]], Optional[dict[int, str]]]:
+            """(succeeded, output) of each input and, for the first compiler, the outputs of the inputs run one after another"""
+            try:
+                comp_out = compiler.compile_program(prog, ExeCompilationOutput(), timeout=5)
+            except:
+                raise ValidateError # the program does not compile, so no input is valid
+            runs = []
+            for pos in range(len(valid)):
+                try:
+                    runs.append((True, self.parse_output(comp_out.output.run((str(pos),), timeout=5).stdout)))
+                except:
+                    runs.append((False, None))
+            seq_outs = None
+            if compiler is self.compilers[0]:
+                # an input that fails in the sequence has no output; the sequence goes on with the next input in a new process
+                seq_outs = {}
+                start = 0
+                while start < len(valid):
+                    positions = list(range(start, len(valid)))
+                    try:
+                        stdout = comp_out.output.run(tuple(map(str, positions)), timeout=5).stdout
+                    except (sp.CalledProcessError, sp.TimeoutExpired) as e:
+                        stdout = e.stdout.decode("utf-8", "replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+                    seq_run = re.findall(r'ret=(.*)', stdout)
+                    seq_outs.update(zip(positions, seq_run))
+                    start += len(seq_run) + 1
+            return runs, seq_outs
+
+        # outs[pos] ==> outputs of valid[pos] from the compilers so far, None once the input is invalid
+        outs = [[] for _ in valid]
+        def check(result):
+            runs, seq_outs = result
+            for pos, (succeeded, out) in enumerate(runs):
+                if outs[pos] is None:
+                    continue
+                if not succeeded:
+                    outs[pos] = None
+                    continue
+                if outs[pos] != [] and outs[pos][0] != out:
+                    raise InconsistentOutputError
+                outs[pos].append(out)
+            if seq_outs is not None:
+                # the sanitizers ran the inputs one after another, which is only meaningful for the inputs
+                # whose output does not depend on the state left by the previous ones, e.g., in globals
+                for pos in range(len(valid)):
+                    if outs[pos] is not None and (pos not in seq_outs or seq_outs[pos] != outs[pos][0]):
+                        outs[pos] = None
+        try:
+            self.run_jobs([lambda compiler=compiler: compile_and_run_batch(compiler) for compiler in self.compilers], check)
+        except ValidateError:
+            return {}
+        return {valid[pos]: out_list[0] for pos, out_list in enumerate(outs) if out_list is not None}
+
     def synthesize_proxy(self, input_func:Function, inp:list[str], debug:bool=False) -> tuple[str, Function]:
         """
         Synthesize a proxy function if needed and generate output from the given input on the new proxy function.
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+import os, argparse
+from functioner import *
+
+if __name__=='__main__':
+
+    parser = argparse.ArgumentParser(description='Convert a json function database to the sqlite format that is loaded lazily.')
+    parser.add_argument('--src', dest='SRC', required=True, help='path to the json function_db_file.')
+    parser.add_argument('--dst', dest='DST', required=True, help='path to the sqlite function_db_file, ending with .sqlite or .db.')
+    args = parser.parse_args()
+    if not os.path.exists(args.SRC):
+        print(f"File {args.SRC} does not exist!")
+        parser.print_help()
+        exit(1)
+    if not args.DST.endswith((".sqlite", ".db")):
+        print(f"The destination {args.DST} should end with .sqlite or .db!")
+        parser.print_help()
+        exit(1)
+
+    functiondb = FunctionDB(args.SRC)
+    write_function_db_sqlite(functiondb, args.DST)
+    print(f"Converted {len(functiondb)} functions to {args.DST}.")
@@ -1,26 +1,31 @@
-import os, json
-from typing import Optional
+import os, sys, json, sqlite3, struct, shutil, threading
+from functools import lru_cache
+from multiprocessing import shared_memory, resource_tracker
+from typing import Optional, Callable
 from variable import *
 
 
 class Function:
     """A container for a function
     """
-    call_name = ''
-    args_type = ''
-    return_type = ''
-    function_body = ''
-    io_list = []
-    misc = []
-    src_file = ''
-    include_headers = []
-    include_sources = []
-    is_valid:bool = False
-    has_io:bool = False
-    load_from_file:bool = False
+    __slots__ = ("call_name", "args_type", "return_type", "function_body", "io_list", "num_io", "misc", "src_file",
+                 "include_headers", "include_sources", "is_valid", "has_io", "load_from_file")
     def __init__(self, func_json:dict) -> None:
+        self.call_name = ''
+        self.args_type = ''
+        self.return_type = ''
+        self.function_body = ''
+        self.io_list = []
+        self.num_io = 0
+        self.misc = []
+        self.src_file = ''
+        self.include_headers = []
+        self.include_sources = []
+        self.is_valid = False
+        self.has_io = False
+        self.load_from_file = False
         if 'function_name' in func_json:
-            self.call_name = func_json['function_name']
+            self.call_name = sys.intern(func_json['function_name'])
         else:
             return
         if 'parameter_types' in func_json:
@@ -48,7 +53,7 @@ class Function:
             self.src_file = func_json['src_file']
             self.load_from_file = True
         if 'include_headers' in func_json:
-            self.include_headers = func_json['include_headers']
+            self.include_headers = [sys.intern(header) for header in func_json['include_headers']]
         if 'include_sources' in func_json:
             self.include_sources = func_json['include_sources']
     
@@ -75,11 +80,43 @@ class Function:
         return random.choice(self.io_list)
 
 
+class AliasTable:
+    """Sample an index with probability proportional to its weight in O(1), with Vose's alias method
+    """
+    def __init__(self, weights:list[float]) -> None:
+        num = len(weights)
+        total = sum(weights)
+        if num == 0 or total <= 0:
+            raise ValueError("AliasTable needs at least one positive weight")
+        self.prob = [0.0] * num
+        self.alias = list(range(num))
+        scaled = [w * num / total for w in weights]
+        small = [i for i, w in enumerate(scaled) if w < 1.0]
+        large = [i for i, w in enumerate(scaled) if w >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        for i in small + large: # left over because of rounding
+            self.prob[i] = 1.0
+
+    def sample(self) -> int:
+        i = random.randrange(len(self.prob))
+        return i if random.random() < self.prob[i] else self.alias[i]
+
+
 class FunctionDB:
     """A database class that contains a set of Function()
     """
     def __init__(self, func_db_file:Optional[str]=None) -> None:
         self.all_functions = []
+        self.weight = None # weight of each function for sample(), None for uniform
+        self.invalidate_index()
         if func_db_file is None:
             return
         if not os.path.exists(func_db_file):
@@ -95,6 +132,7 @@ class FunctionDB:
         for function in function_list:
             assert isinstance(function, Function)
         self.all_functions = function_list
+        self.invalidate_index()
 
     def __len__(self):
         return len(self.all_functions)
@@ -119,3 +157,279 @@ class FunctionDB:
     def append(self, function:Function):
         assert isinstance(function, Function)
         self.all_functions.append(function)
+        self.invalidate_index()
+
+    def invalidate_index(self) -> None:
+        """Rebuild the sampling index on the next sample(), e.g., after the io_list of a function changed"""
+        self.buckets = None # key:[val] ==> (return_type, num_args):[indices of functions with IO], None for any
+        self.samplers = {} # key:val ==> (return_type, num_args):AliasTable over the bucket
+
+    def set_weight(self, weight:Optional[Callable[[Function], float]]) -> None:
+        """Sample functions with probability proportional to weight(function), None for uniform"""
+        self.weight = weight
+        self.samplers = {}
+
+    def get_bucket(self, return_type:Optional[VarType]=None, num_args:Optional[int]=None) -> list[int]:
+        """Indices of the functions with IO, with the given return type and number of arguments if not None"""
+        if self.buckets is None:
+            self.buckets = {(None, None): [i for i, func in enumerate(self.all_functions) if func.has_io]}
+        key = (return_type, num_args)
+        if key not in self.buckets:
+            self.buckets[key] = [i for i in self.buckets[(None, None)]
+                                 if (return_type is None or self.all_functions[i].return_type == return_type)
+                                 and (num_args is None or len(self.all_functions[i].args_type) == num_args)]
+        return self.buckets[key]
+
+    def sample(self, return_type:Optional[VarType]=None, num_args:Optional[int]=None) -> int:
+        """Randomly select the index of a function with IO in O(1), optionally with the given return type and number of arguments"""
+        bucket = self.get_bucket(return_type, num_args)
+        if len(bucket) == 0:
+            raise ValueError(f"No function with IO (return_type={return_type}, num_args={num_args}) in the database")
+        if self.weight is None:
+            return bucket[random.randrange(len(bucket))]
+        key = (return_type, num_args)
+        if key not in self.samplers:
+            self.samplers[key] = AliasTable([self.weight(self.all_functions[i]) for i in bucket])
+        return bucket[self.samplers[key].sample()]
+
+
+class LazyFunction(Function):
+    """A Function of a LazyFunctionDB.
+    The signature and the number of IO pairs are loaded with the database,
+    the function body, misc, io_list and the source information are fetched when used.
+    """
+    __slots__ = ("function_db", "func_id")
+    def __init__(self, function_db:"LazyFunctionDB", func_id:int, call_name:str, args_type:str, return_type:str, num_io:int) -> None:
+        self.function_db = function_db
+        self.func_id = func_id
+        self.call_name = sys.intern(call_name)
+        self.args_type = VarType.from_list(json.loads(args_type))
+        self.return_type = VarType.from_str(return_type)
+        self.num_io = num_io
+        self.has_io = num_io > 0
+        self.is_valid = True
+        self.load_from_file = False
+
+    @property
+    def function_body(self):
+        return self.function_db.fetch(self.func_id)["function"]
+
+    @property
+    def misc(self):
+        return self.function_db.fetch(self.func_id)["misc"]
+
+    @property
+    def io_list(self):
+        return self.function_db.fetch(self.func_id)["io_list"]
+
+    @property
+    def src_file(self):
+        return self.function_db.fetch(self.func_id)["src_file"]
+
+    @property
+    def include_headers(self):
+        return self.function_db.fetch(self.func_id)["include_headers"]
+
+    @property
+    def include_sources(self):
+        return self.function_db.fetch(self.func_id)["include_sources"]
+
+    def set_io(self, io_list:list) -> None:
+        raise TypeError("LazyFunctionDB is read-only, convert a json database instead")
+
+
+class LazyFunctionDB(FunctionDB):
+    """A read-only FunctionDB backed by the sqlite file written by convert_db.py.
+    Only the signatures are loaded eagerly; the rest of a function is read on demand and kept in an LRU cache.
+    """
+    FETCH_CACHE_SIZE = 1024 # number of functions whose body, misc and io_list are kept in memory
+
+    def __init__(self, func_db_file:str) -> None:
+        super().__init__()
+        if not os.path.exists(func_db_file):
+            raise ValueError(f"{func_db_file} does not exist!")
+        self.db_file = func_db_file
+        self.local = threading.local()
+        self.fetch = lru_cache(maxsize=LazyFunctionDB.FETCH_CACHE_SIZE)(self.fetch_uncached)
+        rows = self.connect().execute("SELECT id, function_name, parameter_types, return_type, num_io FROM functions ORDER BY id")
+        self.all_functions = [LazyFunction(self, *row) for row in rows]
+        assert all(func.func_id == i for i, func in enumerate(self.all_functions)), "function ids must be 0..N-1"
+
+    def connect(self) -> sqlite3.Connection:
+        """One read-only connection per thread and process, as sqlite connections must not cross either"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True)
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def fetch_uncached(self, func_id:int) -> dict:
+        """Read the lazily loaded fields of a function"""
+        row = self.connect().execute(
+            "SELECT function, misc, io_list, src_file, include_headers, include_sources FROM functions WHERE id=?", (func_id,)
+        ).fetchone()
+        return {
+            "function": row[0],
+            "misc": json.loads(row[1]),
+            "io_list": json.loads(row[2]),
+            "src_file": row[3],
+            "include_headers": json.loads(row[4]),
+            "include_sources": json.loads(row[5]),
+        }
+
+    def from_list(self, function_list:list[Function]) -> None:
+        raise TypeError("LazyFunctionDB is read-only")
+
+    def append(self, function:Function):
+        raise TypeError("LazyFunctionDB is read-only")
+
+
+def attach_shared_memory(name:str) -> shared_memory.SharedMemory:
+    """Attach to an existing shared memory block without registering it with the resource tracker,
+    which would otherwise unlink it when the attaching process exits."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class SharedFunctionList:
+    """The read-only all_functions of a SharedFunctionDB, decoding a Function on access"""
+    def __init__(self, function_db:"SharedFunctionDB") -> None:
+        self.function_db = function_db
+
+    def __len__(self):
+        return self.function_db.num_functions
+
+    def __getitem__(self, i:int) -> Function:
+        return self.function_db.decode(range(len(self))[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class SharedFunctionDB(FunctionDB):
+    """A read-only FunctionDB published once in shared memory, so that pool workers attach to it by name
+    instead of parsing the database or receiving pickled functions.
+    Layout: N | offsets of the N+1 records | num_args[N] | has_io[N] | return_type[N] | json records
+    sample() reads the arrays only; a Function is decoded from its record when accessed and kept in an LRU cache.
+    Pickling a SharedFunctionDB attaches to the same block, e.g., when it is passed to spawned workers.
+    """
+    DECODE_CACHE_SIZE = 1024 # number of decoded functions kept in memory per process
+
+    def __init__(self, shm:shared_memory.SharedMemory, owner:bool=False) -> None:
+        super().__init__()
+        self.shm = shm
+        self.owner_pid = os.getpid() if owner else None # only the publishing process unlinks the block
+        num = struct.unpack_from("<Q", shm.buf, 0)[0]
+        start = 8
+        self.offsets = shm.buf[start:start + 8 * (num + 1)].cast("Q")
+        start += 8 * (num + 1)
+        self.num_args = shm.buf[start:start + 2 * num].cast("H")
+        start += 2 * num
+        self.has_io_flags = shm.buf[start:start + num]
+        start += num
+        self.return_types = shm.buf[start:start + num]
+        self.num_functions = num
+        self.decode = lru_cache(maxsize=SharedFunctionDB.DECODE_CACHE_SIZE)(self.decode_uncached)
+        self.all_functions = SharedFunctionList(self)
+
+    @staticmethod
+    def publish(function_db:FunctionDB, name:Optional[str]=None) -> "SharedFunctionDB":
+        """Copy function_db to a new shared memory block, owned by the calling process"""
+        records = [json.dumps(func.to_json()).encode() for func in function_db.all_functions]
+        num = len(records)
+        header_size = 8 + 8 * (num + 1) + 4 * num
+        size = header_size + sum(len(record) for record in records)
+        # a block larger than /dev/shm can be created but crashes the process with SIGBUS when written
+        if os.path.isdir("/dev/shm") and shutil.disk_usage("/dev/shm").free < size:
+            raise OSError(f"Not enough space in /dev/shm for a function database of {size} bytes")
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(size, 1))
+        offsets = [header_size]
+        for record in records:
+            offsets.append(offsets[-1] + len(record))
+        struct.pack_into(f"<Q{num + 1}Q{num}H", shm.buf, 0, num, *offsets, *[min(len(func.args_type), 0xffff) for func in function_db.all_functions])
+        start = 8 + 8 * (num + 1) + 2 * num
+        shm.buf[start:start + num] = bytes(func.has_io for func in function_db.all_functions)
+        start += num
+        shm.buf[start:start + num] = bytes(func.return_type.value for func in function_db.all_functions)
+        for i, record in enumerate(records):
+            shm.buf[offsets[i]:offsets[i + 1]] = record
+        return SharedFunctionDB(shm, owner=True)
+
+    @staticmethod
+    def attach(name:str) -> "SharedFunctionDB":
+        """Attach read-only to a SharedFunctionDB published by another process"""
+        return SharedFunctionDB(attach_shared_memory(name))
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __reduce__(self):
+        return (SharedFunctionDB.attach, (self.name,))
+
+    def decode_uncached(self, i:int) -> Function:
+        return Function(json.loads(bytes(self.shm.buf[self.offsets[i]:self.offsets[i + 1]])))
+
+    def get_bucket(self, return_type:Optional[VarType]=None, num_args:Optional[int]=None) -> list[int]:
+        """Same as FunctionDB.get_bucket() without decoding any function"""
+        if self.buckets is None:
+            self.buckets = {(None, None): [i for i, has_io in enumerate(self.has_io_flags) if has_io]}
+        key = (return_type, num_args)
+        if key not in self.buckets:
+            self.buckets[key] = [i for i in self.buckets[(None, None)]
+                                 if (return_type is None or self.return_types[i] == return_type.value)
+                                 and (num_args is None or self.num_args[i] == num_args)]
+        return self.buckets[key]
+
+    def from_list(self, function_list:list[Function]) -> None:
+        raise TypeError("SharedFunctionDB is read-only")
+
+    def append(self, function:Function):
+        raise TypeError("SharedFunctionDB is read-only")
+
+    def close(self) -> None:
+        """Detach from the block, and remove it if this process published it"""
+        for view in (self.offsets, self.num_args, self.has_io_flags, self.return_types):
+            view.release()
+        self.decode.cache_clear()
+        self.shm.close()
+        if self.owner_pid == os.getpid():
+            self.shm.unlink()
+
+
+def write_function_db_sqlite(function_db:FunctionDB, db_file:str) -> None:
+    """Save function_db in the format of LazyFunctionDB, the function ids are the indices in function_db"""
+    tmp_file = f"{db_file}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    conn = sqlite3.connect(tmp_file)
+    conn.execute(
+        "CREATE TABLE functions ("
+        "id INTEGER PRIMARY KEY, function_name TEXT NOT NULL, parameter_types TEXT NOT NULL, return_type TEXT NOT NULL, "
+        "num_io INTEGER NOT NULL, function TEXT NOT NULL, misc TEXT NOT NULL, io_list TEXT NOT NULL, "
+        "src_file TEXT NOT NULL, include_headers TEXT NOT NULL, include_sources TEXT NOT NULL)"
+    )
+    conn.executemany(
+        "INSERT INTO functions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((i, func_json["function_name"], json.dumps(func_json["parameter_types"]), func_json["return_type"],
+          len(func_json["io_list"]), func_json["function"], json.dumps(func_json["misc"]), json.dumps(func_json["io_list"]),
+          func_json["src_file"], json.dumps(func_json["include_headers"]), json.dumps(func_json["include_sources"]))
+         for i, func_json in enumerate(func.to_json() for func in function_db.all_functions)),
+    )
+    conn.commit()
+    conn.close()
+    os.replace(tmp_file, db_file)
+
+
+def load_function_db(func_db_file:str) -> FunctionDB:
+    """Load a json database eagerly or a sqlite database written by convert_db.py lazily"""
+    if func_db_file.endswith((".sqlite", ".db")):
+        return LazyFunctionDB(func_db_file)
+    return FunctionDB(func_db_file)
@@ -129,6 +129,7 @@ if __name__=='__main__':
     cpu_count = mp.cpu_count()
     cpu_use = cpu_count if args.CPU == -1 else min(cpu_count, args.CPU)
     results = []
+    # the workers only receive source paths and return the extracted functions, so there is no function database to share
     with tqdm(total=len(src_files)) as pbar, mp.Pool(cpu_use) as pool:
         for res in pool.imap(extract_one_file, src_files):
             pbar.update()
@@ -9,6 +9,17 @@ from functioner import *
 DEBUG = False
 
 NUM_IO=5
+BATCH_SIZE=0 # number of candidate inputs compiled into one program, 0 to compile a program for every input
+MATRIX_JOBS=1 # number of compilers running at the same time for one function
+FUNCTION_DB = None # the SharedFunctionDB attached by each worker
+
+def init_worker(num_io:int, batch_size:int, matrix_jobs:int, function_db_name:str) -> None:
+    """Attach the worker to the function database published by the main process"""
+    global NUM_IO, BATCH_SIZE, MATRIX_JOBS, FUNCTION_DB
+    NUM_IO = num_io
+    BATCH_SIZE = batch_size
+    MATRIX_JOBS = matrix_jobs
+    FUNCTION_DB = SharedFunctionDB.attach(function_db_name)
 
 def generate_io(input_func: Function)->Function:
     """Generate IO pairs
@@ -19,7 +30,17 @@ def generate_io(input_func: Function)->Function:
     if 'inline ' in input_func.function_body and 'static' not in input_func.function_body:
         input_func.function_body = input_func.function_body.replace('inline ', ' ')
 
-    iogenerator = IOGenerator()
+    iogenerator = IOGenerator(matrix_jobs=MATRIX_JOBS)
+    if BATCH_SIZE > 0:
+        try:
+            io_list, new_func = iogenerator.generate_batch(input_func, NUM_IO, BATCH_SIZE, debug=DEBUG)
+        except InconsistentOutputError:
+            # we probably meet a violation of strict aliasing
+            return None
+        if len(io_list) != 0:
+            new_func.set_io(io_list)
+            return new_func
+        return None
     io_list = []
     num_generated = 0
     new_func = None
@@ -44,6 +65,10 @@ def generate_io(input_func: Function)->Function:
     else:
         return None
 
+def generate_io_at(func_idx:int)->Function:
+    """generate_io() for the function at func_idx of the worker's FUNCTION_DB"""
+    return generate_io(FUNCTION_DB[func_idx])
+
 
 if __name__=='__main__':
 
@@ -51,13 +76,17 @@ if __name__=='__main__':
     parser.add_argument('--src', dest='SRC', required=True, help='path to the source function_db_file.')
     parser.add_argument('--dst', dest='DST', required=True, help='path to the destination function_db_file with io.')
     parser.add_argument('--num', dest='NUM', default=5, type=int, help='number of io pairs generated for each function. (default=5)')
-    parser.add_argument('--cpu', dest='CPU', default=-1, type=int, help='number of io pairs generated for each function. (default=#ALL_CPUs)')
+    parser.add_argument('--batch', dest='BATCH', default=0, type=int, help='number of candidate inputs compiled and sanitized together in one program, 0 to compile a program for every input. (default=0)')
+    parser.add_argument('--cpu', dest='CPU', default=-1, type=int, help='number of CPUs used in total, by --matrix-jobs threads in each worker process. (default=#ALL_CPUs)')
+    parser.add_argument('--matrix-jobs', dest='MATRIX_JOBS', default=1, type=int, help='number of compilers running at the same time for one function, the sanitizers always run one by one. (default=1)')
     args = parser.parse_args()
     if not os.path.exists(args.SRC):
         print(f"File {args.SRC} does not exist!")
         parser.print_help()
         exit(1)
     NUM_IO = args.NUM
+    BATCH_SIZE = max(0, args.BATCH)
+    MATRIX_JOBS = max(1, args.MATRIX_JOBS)
     
     # construct function database
     functiondb = FunctionDB(args.SRC)
@@ -78,11 +107,18 @@ if __name__=='__main__':
 
     cpu_count = mp.cpu_count()
     cpu_use = cpu_count if args.CPU == -1 else min(cpu_count, args.CPU)
-    with tqdm(total=len(functiondb)) as pbar, mp.Pool(cpu_use) as pool:
-        for idx, new_func in enumerate(pool.imap(generate_io, functiondb)):
-            pbar.update()
-            if new_func is not None:
-                new_functiondb.append(new_func)
+    # each worker runs up to MATRIX_JOBS compilations at the same time
+    num_workers = max(1, cpu_use // MATRIX_JOBS)
+    # the workers attach to the database in shared memory and only receive the index of each function
+    shared_functiondb = SharedFunctionDB.publish(functiondb)
+    try:
+        with tqdm(total=len(functiondb)) as pbar, mp.Pool(num_workers, initializer=init_worker, initargs=(NUM_IO, BATCH_SIZE, MATRIX_JOBS, shared_functiondb.name)) as pool:
+            for idx, new_func in enumerate(pool.imap(generate_io_at, range(len(functiondb)))):
+                pbar.update()
+                if new_func is not None:
+                    new_functiondb.append(new_func)
+    finally:
+        shared_functiondb.close()
     
     with open(args.DST, "w") as f:
         json.dump(new_functiondb.to_json(), f)
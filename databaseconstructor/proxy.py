@@ -222,18 +222,51 @@ int main() {
 }
 """
 
-def generate_closure_program(proxy_function:Function, input_function:Function, synthesized_intput:list[str]) -> tuple[str, Function]:
+BATCH_DRIVER_FUNC = """
+#include <stdio.h>
+
+RealSmith_MISC_PLACEHOLDER
+
+RealSmith_FUNCTION_PLACEHOLDER
+
+PROXY_FUNCTION_PLACEHOLDER
+
+long long realsmith_batch_call(int realsmith_idx) {
+    long long ret = 0;
+    switch (realsmith_idx) {
+BATCH_CALLS_PLACEHOLDER
+    }
+    return ret;
+}
+
+/* parsed by hand, as stdlib.h would declare names such as abs or rand that the database functions may define */
+int realsmith_parse_index(const char *str) {
+    int idx = 0;
+    for (; *str >= '0' && *str <= '9'; str++)
+        idx = idx * 10 + (*str - '0');
+    return idx;
+}
+
+int main(int argc, char **argv) {
+    /* run the inputs whose indices are given in argv, or all inputs in order */
+    int num = argc > 1 ? argc - 1 : NUM_INPUTS_PLACEHOLDER;
+    for (int i = 0; i < num; i++) {
+        int idx = argc > 1 ? realsmith_parse_index(argv[i + 1]) : i;
+        printf(\"ret=%lld\\n\", realsmith_batch_call(idx));
+        fflush(stdout); /* keep the outputs of the previous inputs if this one crashes */
+    }
+    return 0;
+}
+"""
+
+def generate_call(proxy_function:Function, input_function:Function, synthesized_intput:list[str]) -> tuple[str, str, str]:
+    """The statements before the call, the called function and its arguments for one input"""
     synthesized_intput = deepcopy(synthesized_intput)
-    RealSmith_MISC_PLACEHOLDER = '\n'.join(input_function.misc)
-    RealSmith_FUNCTION_PLACEHOLDER = input_function.function_body
     if proxy_function.function_body == '':
-        PROXY_FUNCTION_PLACEHOLDER = ""
         FUNCTION_CALL_PLACEHOLDER = input_function.call_name
     else:
-        PROXY_FUNCTION_PLACEHOLDER = proxy_function.function_body
         FUNCTION_CALL_PLACEHOLDER = proxy_function.call_name
 
-    PRE_CALL_PLACEHOLDER = ""
     pre_call_list = []
     for idx in range(len(proxy_function.args_type)):
         arg_type = proxy_function.args_type[idx]
@@ -243,9 +276,27 @@ def generate_closure_program(proxy_function:Function, input_function:Function, s
             arg_var_value = VarType.get_random_value(VarType.get_base_type(arg_type))
             pre_call_list.append(f"{VarType.to_str(VarType.get_base_type(arg_type))} {arg_var_base} = {arg_var_value}; {VarType.to_str(arg_type)} {arg_var} = &{arg_var_base};")
             synthesized_intput[idx] = arg_var
-    PRE_CALL_PLACEHOLDER += "\n".join(pre_call_list)
+    PRE_CALL_PLACEHOLDER = "\n".join(pre_call_list)
 
     CALL_ARGS = ", ".join(list(map(str, synthesized_intput)))
+    return PRE_CALL_PLACEHOLDER, FUNCTION_CALL_PLACEHOLDER, CALL_ARGS
+
+def merge_proxy_function(proxy_function:Function, input_function:Function) -> Function:
+    """The function whose IO pairs are recorded: the proxy function including the input function if there is a proxy"""
+    if proxy_function.function_body != '':
+        proxy_function.function_body = f"{input_function.function_body}\n{proxy_function.function_body}"
+        proxy_function.misc = input_function.misc
+        return proxy_function
+    return input_function
+
+def generate_closure_program(proxy_function:Function, input_function:Function, synthesized_intput:list[str]) -> tuple[str, Function]:
+    RealSmith_MISC_PLACEHOLDER = '\n'.join(input_function.misc)
+    RealSmith_FUNCTION_PLACEHOLDER = input_function.function_body
+    if proxy_function.function_body == '':
+        PROXY_FUNCTION_PLACEHOLDER = ""
+    else:
+        PROXY_FUNCTION_PLACEHOLDER = proxy_function.function_body
+    PRE_CALL_PLACEHOLDER, FUNCTION_CALL_PLACEHOLDER, CALL_ARGS = generate_call(proxy_function, input_function, synthesized_intput)
 
     POST_CALL_PLACEHOLDER = ""
     # construct the program
@@ -265,10 +316,29 @@ def generate_closure_program(proxy_function:Function, input_function:Function, s
         .replace(
         "POST_CALL_PLACEHOLDER", POST_CALL_PLACEHOLDER)
     
-    if proxy_function.function_body != '':
-        proxy_function.function_body = f"{input_function.function_body}\n{proxy_function.function_body}"
-        proxy_function.misc = input_function.misc
-        new_function = proxy_function
-    else:
-        new_function = input_function
+    new_function = merge_proxy_function(proxy_function, input_function)
     return closure_program, new_function
+
+def generate_batch_closure_program(proxy_function:Function, input_function:Function, batch_calls:list[tuple[str, str, str]]) -> str:
+    """
+    A closure program that evaluates several inputs, each given by generate_call().
+    Running it with input indices as arguments prints "ret=" for each of them, e.g., `./a.out 2` for batch_calls[2];
+    running it without arguments prints "ret=" for all inputs in order.
+    Unlike generate_closure_program(), proxy_function is left unchanged so that the program can be rebuilt for a subset of the inputs.
+    """
+    BATCH_CALLS_PLACEHOLDER = "\n".join(
+        f"    case {idx}: {{\n{pre_call}\nret = {function_call}({call_args});\nbreak;\n    }}"
+        for idx, (pre_call, function_call, call_args) in enumerate(batch_calls)
+    )
+    closure_program = BATCH_DRIVER_FUNC\
+        .replace(
+        "BATCH_CALLS_PLACEHOLDER", BATCH_CALLS_PLACEHOLDER)\
+        .replace(
+        "NUM_INPUTS_PLACEHOLDER", str(len(batch_calls)))\
+        .replace(
+        "RealSmith_MISC_PLACEHOLDER", '\n'.join(input_function.misc))\
+        .replace(
+        "RealSmith_FUNCTION_PLACEHOLDER", input_function.function_body)\
+        .replace(
+        "PROXY_FUNCTION_PLACEHOLDER", proxy_function.function_body)
+    return closure_program
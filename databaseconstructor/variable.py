@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from functools import lru_cache
 import random
 import ctypes
 
@@ -31,22 +32,24 @@ class VarType(Enum):
 
     def __eq__(self, other_type):
         return self.value == other_type.value
+
+    def __hash__(self):
+        # consistent with __eq__, so that the same type imported through different module paths is the same dict key
+        return hash(self._value_)
     
     @staticmethod
+    @lru_cache(maxsize=4096)
     def from_str(type_str:str):
         type_str = type_str.strip()
         if "const" in type_str:
             Warning(f"{type_str} found. We now only ignore the \"const\".")
             type_str = type_str.replace("const", "").strip()
-        for map_type in VAR_MAP:
-            for map_type_str in map_type.type_str_list:
-                if map_type_str == type_str:
-                    return VarType(map_type.vartype.value)
+        if type_str in STR_TO_TYPE:
+            return STR_TO_TYPE[type_str]
         if type_str.count("*") == 1:
             base_type = VarType.from_str(type_str.replace("*", "").strip())
-            for map_type in VAR_MAP:
-                if map_type.vartype == base_type:
-                    return VarType(map_type.pointertype.value)
+            if base_type in TYPE_INFO:
+                return TYPE_INFO[base_type].pointertype
         # we now treat all other types as int
         return VarType.INT32
         # raise ValueError(f"{type_str} is not a valid variable type")
@@ -57,27 +60,24 @@ class VarType(Enum):
         
     @staticmethod
     def get_base_type(var_type):
-        for map_type in VAR_MAP:
-            if map_type.pointertype == var_type:
-                return VarType(map_type.vartype.value)
-            if map_type.vartype == var_type:
-                return VarType(map_type.vartype.value)
+        if var_type in POINTER_INFO:
+            return POINTER_INFO[var_type].vartype
+        if var_type in TYPE_INFO:
+            return TYPE_INFO[var_type].vartype
         raise ValueError("Unknown pointer type from VarType.get_pointer_base_type")
     
     @staticmethod
     def to_str(vartype):
-        for map_type in VAR_MAP:
-            if vartype == map_type.vartype:
-                return map_type.type_str_list[0]
-            if vartype == map_type.pointertype:
-                return f"{map_type.type_str_list[0]} *"
+        if vartype in TYPE_INFO:
+            return TYPE_INFO[vartype].type_str_list[0]
+        if vartype in POINTER_INFO:
+            return f"{POINTER_INFO[vartype].type_str_list[0]} *"
         raise ValueError
     
     @staticmethod
     def get_range(var_type):
-        for type_info in VAR_MAP:
-            if type_info.vartype == var_type:
-                return type_info.range_list[0], type_info.range_list[1]
+        if var_type in TYPE_INFO:
+            return TYPE_INFO[var_type].range_list[0], TYPE_INFO[var_type].range_list[1]
         return -1, -1
     
     @staticmethod
@@ -110,20 +110,42 @@ class VarType(Enum):
     @staticmethod
     def get_ctypes(var_type, var_value=None):
         """Get a ctype object"""
-        for map_type in VAR_MAP:
-            if var_type == map_type.vartype:
-                if var_value == None:
-                    return map_type.ctypes_conver_func
-                else:
-                    return map_type.ctypes_conver_func(var_value)
+        if var_type in TYPE_INFO:
+            if var_value == None:
+                return TYPE_INFO[var_type].ctypes_conver_func
+            else:
+                return TYPE_INFO[var_type].ctypes_conver_func(var_value)
         raise(f"Cannot get ctypes of {VarType.to_str(var_type)}.")
     
+    @staticmethod
+    def wrap(var_type, var_value:int) -> int:
+        """Convert var_value to var_type like a C cast, i.e., VarType.get_ctypes(var_type, var_value).value without the ctypes object"""
+        width = INT_WIDTH.get(var_type)
+        if width is None:
+            return VarType.get_ctypes(var_type, var_value).value
+        bits, signed = width
+        var_value &= (1 << bits) - 1
+        if signed and var_value >> (bits - 1):
+            var_value -= 1 << bits
+        return var_value
+
+    @staticmethod
+    def wrap_list(var_type, var_values:list[int]) -> list[int]:
+        """VarType.wrap() of each value in var_values"""
+        if len(var_values) == 0 or var_type not in INT_WIDTH:
+            return [VarType.wrap(var_type, var_value) for var_value in var_values]
+        bits, signed = INT_WIDTH[var_type]
+        mask = (1 << bits) - 1
+        if not signed:
+            return [var_value & mask for var_value in var_values]
+        sign_bit = 1 << (bits - 1)
+        return [((var_value & mask) ^ sign_bit) - sign_bit for var_value in var_values]
+
     @staticmethod
     def get_format(var_type):
         """Get the printf format for the type"""
-        for map_type in VAR_MAP:
-            if var_type == map_type.vartype:
-                return map_type.fmt
+        if var_type in TYPE_INFO:
+            return TYPE_INFO[var_type].fmt
         raise(f"Cannot get format of {VarType.to_str(var_type)}.")
 
 class TypeInfo:
@@ -151,11 +173,23 @@ VAR_MAP.append(TypeInfo(VarType.CHAR, VarType.PTR_CHAR, ["char"], [-128, 127], c
 VAR_MAP.append(TypeInfo(VarType.UCHAR, VarType.PTR_UCHAR, ["unsigned char"], [0, 255], ctypes.c_uint8, "PRIu8"))
 VAR_MAP.append(TypeInfo(VarType.VOID, VarType.PTR_VOID, ["void"], [0, 0], None, None))
 
+# lookup tables of VAR_MAP, the first entry wins as in a linear scan
+TYPE_INFO = {} # key:val ==> base VarType:TypeInfo
+POINTER_INFO = {} # key:val ==> pointer VarType:TypeInfo of its base type
+STR_TO_TYPE = {} # key:val ==> type string:VarType
+INT_WIDTH = {} # key:val ==> base VarType:(number of bits, is signed)
+for type_info in VAR_MAP:
+    TYPE_INFO.setdefault(type_info.vartype, type_info)
+    if type_info.ctypes_conver_func is not None:
+        INT_WIDTH.setdefault(type_info.vartype, ((type_info.range_list[1] - type_info.range_list[0]).bit_length(), type_info.range_list[0] < 0))
+    POINTER_INFO.setdefault(type_info.pointertype, type_info)
+    for type_str in type_info.type_str_list:
+        STR_TO_TYPE.setdefault(type_str, type_info.vartype)
+
 
 def CAST_VAR(value:int, from_type:VarType, to_type:VarType) -> int:
     """
     Casting the value from type 'from_type' to type 'to_type'
     """
-    for var_map in VAR_MAP:
-        if var_map.vartype == to_type:
-            return var_map.ctypes_conver_func(value)
+    if to_type in TYPE_INFO:
+        return VarType.wrap(to_type, value)
@@ -14,7 +14,7 @@ from diopter.compiler import (
 from diopter.sanitizer import Sanitizer
 from diopter.utils import TempDirEnv
 import subprocess as sp
-from synthesizer.synthesizer import Synthesizer, SynthesizerError
+from synthesizer.synthesizer import Synthesizer, SynthesizerError, TAG_CHANNELS
 from utils.compcert import CComp as this_CComp
 from pathlib import Path
 
@@ -221,6 +221,8 @@ if __name__=='__main__':
     parser.add_argument("--dst", required=True, type=Path, help="Destination directory for generated seeds.")
     parser.add_argument("--syn-prob", required=True, type=int, help="Synthesis probability")
     parser.add_argument("--num-mutants", required=True, type=int, help="The number of mutants per seed by realsmith")
+    parser.add_argument("--profile-cache-dir", default=None, type=str, help="Directory to cache the profiled seeds, so that more mutants of a known seed skip the profiler. (default=disabled)")
+    parser.add_argument("--tag-channel", default="text", choices=TAG_CHANNELS, help="How the profiled seed reports values: printf to stdout (text) or fixed-size records written at exit (binary). (default=text)")
     args = parser.parse_args()
 
     dst_dir = Path(args.dst)
@@ -232,7 +234,7 @@ if __name__=='__main__':
         "gcc -O0",
         "clang -O0"
     ]
-    SYNER = Synthesizer(func_database=FUNCTION_DB_FILE, prob=args.syn_prob)
+    SYNER = Synthesizer(func_database=FUNCTION_DB_FILE, prob=args.syn_prob, profile_cache_dir=args.profile_cache_dir, tag_channel=args.tag_channel)
     with TempDirEnv() as tmp_dir:
         os.environ['TMPDIR'] = tmp_dir.absolute().as_posix()
         total = 0
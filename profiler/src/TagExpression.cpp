@@ -8,6 +8,11 @@ std::map<int, std::string> Tags{{0, ""}};
 
 std::list<std::tuple<int64_t, std::string>> StmtVars;
 
+void resetTags() {
+    Tags = {{0, ""}};
+    StmtVars.clear();
+}
+
 class TagExpressionAction : public MatchComputation<std::string> {
 public:
     TagExpressionAction() = default;
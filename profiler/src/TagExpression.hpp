@@ -6,6 +6,9 @@ namespace tagexpression {
 
 extern std::map<int, std::string> Tags; // <id, type>
 
+// Forget the tags of the previous file, so that a server can profile several files
+void resetTags();
+
 struct clang::transformer::RewriteRule TagExpressionRule();
 struct clang::transformer::RewriteRule TagStatementRule();
 
@@ -31,6 +31,12 @@ cl::opt<profiler::ToolMode>
          cl::init(profiler::ToolMode::Expression),
          cl::cat(ToolOptions));
 
+cl::opt<bool>
+    Server("server", cl::desc("Read source file paths from stdin, one per line, "
+                              "profile each in place and reply OK or ERROR on stdout."),
+           cl::init(false),
+           cl::cat(ToolOptions));
+
 bool applyReplacements(RefactoringTool &Tool) {
     LangOptions DefaultLangOptions;
     IntrusiveRefCntPtr<DiagnosticOptions> DiagOpts = new DiagnosticOptions();
@@ -75,12 +81,26 @@ template <typename InstrTool> int runToolOnCode(RefactoringTool &Tool) {
     return Ret;
 }
 
+int runServer(const CompilationDatabase &Compilations) {
+    std::string File;
+    while (std::getline(std::cin, File)) {
+        if (File.empty())
+            continue;
+        tagexpression::resetTags();
+        RefactoringTool Tool(Compilations, {File});
+        int Result = runToolOnCode<profiler::ProfilerEntry>(Tool);
+        // std::endl flushes, the client waits for the reply
+        std::cout << (Result ? "ERROR" : "OK") << std::endl;
+    }
+    return 0;
+}
+
 
 } // namespace
 
 int main(int argc, const char **argv) {
     auto ExpectedParser =
-        CommonOptionsParser::create(argc, argv, ToolOptions);
+        CommonOptionsParser::create(argc, argv, ToolOptions, cl::ZeroOrMore);
     if (!ExpectedParser) {
         llvm::errs() << ExpectedParser.takeError();
         return 1;
@@ -89,6 +109,12 @@ int main(int argc, const char **argv) {
 
     const auto &Compilations = OptionsParser.getCompilations();
     const auto &Files = OptionsParser.getSourcePathList();
+    if (Server)
+        return runServer(Compilations);
+    if (Files.empty()) {
+        llvm::errs() << "No input files.\n";
+        return 1;
+    }
     RefactoringTool Tool(Compilations, Files);
     int Result = 0;
     Result = runToolOnCode<profiler::ProfilerEntry>(Tool);
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, re, tempfile, sys, argparse, shutil
+import os, re, tempfile, sys, argparse, shutil, hashlib, pickle, zlib, threading, mmap
 from datetime import datetime
 from copy import deepcopy, copy
 import random
@@ -9,14 +9,49 @@ from enum import Enum, auto
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 from databaseconstructor.functioner import *
 from databaseconstructor.variable import *
+from utils.pch import PCHCache
 
 CC1 = "gcc" # use two compilers to avoid unspecified behavior
 CC2 = "clang"
+PROFILER_PCH_COMPILER = "clang" # builds the precompiled header for the profiler, which is a clang tool
 NUM_ENV = 5 # number of env variables used for each tag, "1" means one env_val, e.g., Tag1:tag_val:env_val
 PROFILER = f"{os.path.dirname(__file__)}/../profiler/build/bin/profiler --mode=expr"
 CSMITH_HOME = os.environ["CSMITH_HOME"]
 
 INVALID_TAG_VALUE = 111 # we use this value to indicate invalid tag values
+PROFILE_TIMEOUT = 3 # seconds to run the profiled seed
+TAG_CHANNELS = ["text", "binary"] # how Tag functions report values: printf to stdout, or fixed-size records written to a file at exit
+TAG_CHANNEL_ENV = "CREAL_TAG_CHANNEL" # names the record file of the binary tag channel
+TAG_RECORD_SIZE = 16 # struct creal_tag_record {int32_t tag; int32_t idx; int64_t val;}
+TAG_CHANNEL_PRELUDE = f"""#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+struct creal_tag_record {{ int32_t tag; int32_t idx; int64_t val; }};
+static struct creal_tag_record creal_tag_buf[4096];
+static int creal_tag_len = 0;
+static int creal_tag_registered = 0;
+static FILE *creal_tag_file = 0;
+static void creal_tag_flush(void) {{
+    const char *path;
+    if (creal_tag_file == 0 && (path = getenv("{TAG_CHANNEL_ENV}")) != 0)
+        creal_tag_file = fopen(path, "wb");
+    if (creal_tag_file != 0) {{
+        fwrite(creal_tag_buf, sizeof(struct creal_tag_record), creal_tag_len, creal_tag_file);
+        fflush(creal_tag_file);
+    }}
+    creal_tag_len = 0;
+}}
+static void creal_tag_record(int32_t tag, int32_t idx, int64_t val) {{
+    if (!creal_tag_registered) {{ creal_tag_registered = 1; atexit(creal_tag_flush); }}
+    if (creal_tag_len == sizeof(creal_tag_buf) / sizeof(creal_tag_buf[0])) creal_tag_flush();
+    creal_tag_buf[creal_tag_len].tag = tag;
+    creal_tag_buf[creal_tag_len].idx = idx;
+    creal_tag_buf[creal_tag_len].val = val;
+    creal_tag_len++;
+}}
+"""
+PROFILE_CACHE_VERSION = 4 # bump this when the profiled state or the way it is computed changes
+PROFILED_STATE = ["tags", "scope_up", "scope_down", "alive_tags", "src_syn_orig", "src_orig", "tag_spans", "header_end_loc"] # attributes cached after profiling
 
 class CMD(Enum):
     OK      =   auto()
@@ -29,29 +64,79 @@ class VarValue(Enum):
 
 class Var:
     """Variable"""
+    __slots__ = ("var_name", "var_type", "var_value", "is_stable", "is_constant", "is_global", "scope_id")
     var_name:str            # variable name
-    var_type:str            # variable type as string
-    var_value:int           # value
-    is_stable:bool = True   # if the variable values is stable, i.e., never changed or len(set(values))<=1.
-    is_constant:bool=False  # variable has "const" keyword
-    is_global:bool=False    # if the vairable has global storage
-    scope_id:int=-1         # scope id of the variable
+    var_type:str            # variable type as string, interned
+    var_value:int           # value, unset until the variable is profiled
+    is_stable:bool          # if the variable values is stable, i.e., never changed or len(set(values))<=1.
+    is_constant:bool        # variable has "const" keyword
+    is_global:bool          # if the vairable has global storage
+    scope_id:int            # scope id of the variable
+
+    def __init__(self) -> None:
+        self.is_stable = True
+        self.is_constant = False
+        self.is_global = False
+        self.scope_id = -1
 
 class Tag:
     """Tag"""
+    __slots__ = ("tag_id", "tag_str", "tag_check_strs", "tag_var", "tag_envs", "statement_id", "is_statement")
     tag_id:int
     tag_str:str                 # the original tag string showsn in the source file
-    tag_check_strs:list[str]=[] # inserted tag and tagcheck strings
+    tag_check_strs:list[str]    # inserted tag and tagcheck strings of this tag
     tag_var:Var                 # tagged variable
     tag_envs:list[Var]          # env vairales
     statement_id:int            # id of the statement that the Tag belongs to
-    is_statement:bool = False   # if this tag is a stand-alone statement
+    is_statement:bool           # if this tag is a stand-alone statement
+
+    def __init__(self) -> None:
+        self.tag_check_strs = []
+        self.tag_envs = []
+        self.is_statement = False
 
 class ScopeTree:
     def __init__(self, id:int) -> None:
         self.parent = None
         self.children = []
         self.id = id
+        self.enter = -1 # the interval [enter, exit] of the depth-first traversal, -1 if the scope is not reachable from a root
+        self.exit = -1
+
+    def is_ancestor_of(self, other:"ScopeTree") -> bool:
+        """If self is a proper ancestor of other; both scopes must have been numbered"""
+        return self.enter < other.enter and other.exit < self.exit
+
+def build_scope_tree(scope_up:dict[int, int]) -> dict[int, ScopeTree]:
+    """
+    Build the scope tree from the child_scope:parent_scope map and number the
+    scopes in depth-first order, so that ancestor queries take constant time.
+    A scope that is its own parent is a root. Scopes in a loop are not numbered.
+    """
+    scope_tree = {}
+    for child_id, parent_id in scope_up.items():
+        for scope_id in (child_id, parent_id):
+            if scope_id not in scope_tree:
+                scope_tree[scope_id] = ScopeTree(scope_id)
+    for child_id, parent_id in scope_up.items():
+        if child_id != parent_id:
+            scope_tree[child_id].parent = scope_tree[parent_id]
+            scope_tree[parent_id].children.append(scope_tree[child_id])
+    counter = 0
+    for root in scope_tree.values():
+        if root.parent is not None:
+            continue
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                node.exit = counter
+            else:
+                node.enter = counter
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+            counter += 1
+    return scope_tree
 
 def run_cmd(cmd, timeout=10, DEBUG=False):
     if type(cmd) is not list:
@@ -82,15 +167,201 @@ def strip_type_str(ori_type_str:str)->str:
         .replace('volatile', '')\
         .strip()
 
+def read_tag_channel(filename:str) -> list[tuple[int, int, int]]:
+    '''Read the (tag, idx, val) records written by the binary tag channel; a truncated last record is ignored'''
+    with open(filename, 'rb') as f:
+        num_records = os.fstat(f.fileno()).st_size // TAG_RECORD_SIZE
+        if num_records == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm)[:num_records*TAG_RECORD_SIZE] as buf, buf.cast('i') as int32s, buf.cast('q') as int64s:
+                return list(zip(int32s[0::4].tolist(), int32s[1::4].tolist(), int64s[1::2].tolist()))
+
+def splice(src:str, edits:list[tuple[int, int, str]]) -> str:
+    '''Replace the non-overlapping spans src[start:end] with new strings in a single pass.
+    Edits at the same position are emitted in the given order.'''
+    segments = []
+    last = 0
+    for start, end, new_str in sorted(edits, key=lambda edit: edit[0]):
+        segments.append(src[last:start])
+        segments.append(new_str)
+        last = end
+    segments.append(src[last:])
+    return ''.join(segments)
+
+class ProfilerServer:
+    """
+    A long-lived profiler process, which saves the tool startup for every seed.
+    It reads one file path per line and replies "OK" or "ERROR" once the file is instrumented in place.
+    """
+    def __init__(self, extra_flags:list[str]=[]) -> None:
+        self.extra_flags = extra_flags # compiler flags after -I, e.g., to use a precompiled header
+        self.process = sp.Popen(PROFILER.split(' ') + ['--server', '--', f'-I{CSMITH_HOME}/include'] + extra_flags,
+                                stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.DEVNULL, encoding="utf-8")
+        self.num_requests = 0
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def profile(self, filename:str, timeout:int=10) -> CMD | None:
+        """Instrument filename. Return None if the server died, then the file has to be profiled otherwise."""
+        self.num_requests += 1
+        timed_out = threading.Event()
+        def kill_on_timeout():
+            timed_out.set()
+            self.process.kill()
+        watchdog = threading.Timer(timeout, kill_on_timeout)
+        watchdog.start()
+        try:
+            self.process.stdin.write(filename + "\n")
+            self.process.stdin.flush()
+            reply = self.process.stdout.readline().strip()
+        except OSError: # e.g., BrokenPipeError
+            reply = ''
+        finally:
+            watchdog.cancel()
+        if timed_out.is_set():
+            self.close()
+            return CMD.Timeout
+        if reply == "OK":
+            return CMD.OK
+        if reply == "ERROR":
+            return CMD.Error
+        self.close()
+        return None
+
+    def close(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
 MAX_CONST_CCOMP = 4611686018427387904 # 2**62, CompCert cannot handle constant values larger than this
 
+class SynthesisContext:
+    """
+    The state of synthesizing one seed.
+    A Synthesizer only keeps the read-only function database and configuration,
+    so one instance can synthesize several seeds at the same time, each with its own context.
+    """
+    def __init__(self, DEBUG:bool=False) -> None:
+        self.tags = {} # all tags information
+        self.vars = {} # all variale information
+        self.tag_id_list = [] # tag_id in a sequential order as appeared in the execution
+        self.scope_up = {} # key:val ==> child_scope:parent_scope
+        self.scope_down = {} # key:[val] ==> parent_scope:[child_scope(s)]
+        self.alive_tags = [] # all alive tag id
+        self.src_orig = '' # the instrumented seed
+        self.src_syn_orig = '' # the profiled seed that mutants are synthesized from
+        self.src = '' # the current mutant based on src_orig
+        self.src_syn = '' # the current mutant based on src_syn_orig
+        self.tag_spans = {} # key:val ==> tag_id:(start, end) of tag_str in the profiled seed
+        self.stmt_markers = {} # key:[val] ==> (bef|aft, stmt_id):[(start, end)] of the /*bef_stmt:*/ and /*aft_stmt:*/ markers
+        self.tag_def_spans = {} # key:val ==> tag_id:(start, end) of the "#define TagN(x) (x)" line
+        self.header_end_loc = 0 # offset right after the last header include in the profiled seed
+        self.tag_order = [] # tag_id in the order as appeared in the source file
+        self.tag_pos = {} # key:val ==> tag_id:index in tag_order
+        self.scope_tree = {} # key:val ==> scope_id:ScopeTree node
+        self.visible_scopes = {} # key:val ==> scope:set of scopes accessible from it, memoized by get_visible_scopes()
+        self.syn_edits = [] # (start, end, new_str) edits to src_syn_orig that make up the current mutant
+        self.DEBUG = DEBUG
+
 class Synthesizer:
-    def __init__(self, func_database:str, prob:int) -> None:
+    def __init__(self, func_database:str|FunctionDB, prob:int, profile_cache_dir:str|None=None, tag_channel:str="text",
+                 profiler_server:bool=False, pch_cache:PCHCache|None=None) -> None:
+        """
+        func_database:str|FunctionDB -> path to the function database, or an already loaded one, e.g., a SharedFunctionDB
+        profile_cache_dir:str -> directory to cache the profiled seeds, None to disable the cache
+        tag_channel:str -> how the profiled seed reports tag values, one of TAG_CHANNELS
+        profiler_server:bool -> keep a profiler server per thread instead of starting the profiler for every seed
+        pch_cache:PCHCache -> precompiled csmith.h headers for the profiler and the profiling build, None to disable
+        """
         assert 0 < prob <= 100
+        assert tag_channel in TAG_CHANNELS
         self.prob = prob
-        self.functionDB = FunctionDB(func_database)
+        self.tag_channel = tag_channel
+        self.functionDB = func_database if isinstance(func_database, FunctionDB) else load_function_db(func_database)
+        self.profile_cache_dir = profile_cache_dir
+        if self.profile_cache_dir is not None:
+            os.makedirs(self.profile_cache_dir, exist_ok=True)
+        self.profiler_version = None
+        self.profiler_server = profiler_server
+        self.profiler_servers = threading.local() # one server per thread and process, like sqlite connections
+        self.pch_cache = pch_cache
+        self.profiler_pch = pch_cache is not None # the profiler may use a precompiled header built by clang
+        self.profiler_lock = threading.Lock() # guards the downgrades of profiler_server and profiler_pch
+
+    def get_profiler_version(self) -> str:
+        """Identify the profiler binary and the profiling settings, so that cached profiles are invalidated when they change"""
+        if self.profiler_version is None:
+            profiler_bin = PROFILER.split(' ')[0]
+            stat = os.stat(profiler_bin) if os.path.exists(profiler_bin) else None
+            profiler_id = f"{stat.st_size}-{stat.st_mtime_ns}" if stat is not None else "none"
+            self.profiler_version = f"{PROFILE_CACHE_VERSION}-{profiler_id}-{NUM_ENV}-{CC1}-{self.tag_channel}"
+        return self.profiler_version
+
+    def run_profiler(self, ctx:SynthesisContext, filename:str, use_pch:bool|None=None) -> CMD:
+        """Instrument filename in place with the profiler, through the server of this thread if enabled.
+        use_pch:bool -> use the precompiled header for this call, None to follow profiler_pch
+        """
+        if use_pch is None:
+            use_pch = self.profiler_pch
+        pch_flags = self.pch_cache.get_flags(PROFILER_PCH_COMPILER) if use_pch else []
+        ret = None
+        if self.profiler_server:
+            server = getattr(self.profiler_servers, "server", None)
+            if server is None or self.profiler_servers.pid != os.getpid() or not server.alive() or server.extra_flags != pch_flags:
+                if server is not None and self.profiler_servers.pid == os.getpid():
+                    server.close()
+                server = ProfilerServer(pch_flags)
+                self.profiler_servers.server = server
+                self.profiler_servers.pid = os.getpid()
+            ret = server.profile(filename)
+            if ret is None:
+                # the server died; a server that never answered is not supported by the profiler build
+                self.profiler_servers.server = None
+                if server.num_requests == 1:
+                    with self.profiler_lock:
+                        self.profiler_server = False
+        if ret is None:
+            ret, _ = run_cmd(f"{PROFILER} {filename} -- {' '.join([f'-I{CSMITH_HOME}/include'] + pch_flags)}", DEBUG=ctx.DEBUG)
+        if ret == CMD.Error and len(pch_flags) > 0:
+            # the profiler may be built with another clang than the one that built the header,
+            # keep using the header only if the seed cannot be profiled without it either
+            ret = self.run_profiler(ctx, filename, use_pch=False)
+            if ret == CMD.OK:
+                with self.profiler_lock:
+                    self.profiler_pch = False
+        return ret
+
+    def get_profile_cache_file(self, src_filename:str) -> str | None:
+        """The cache file of the profiled seed, keyed by the seed hash and the profiler version"""
+        if self.profile_cache_dir is None:
+            return None
+        with open(src_filename, 'rb') as f:
+            seed_hash = hashlib.sha256(f.read()).hexdigest()
+        version_hash = hashlib.sha256(self.get_profiler_version().encode()).hexdigest()[:16]
+        return os.path.join(self.profile_cache_dir, f"{seed_hash}_{version_hash}.profile")
+
+    def load_profile(self, ctx:SynthesisContext, cache_file:str) -> bool:
+        """Restore the profiled state from cache_file. Return False if it is not cached."""
+        try:
+            with open(cache_file, 'rb') as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, AttributeError):
+            return False
+        for attr in PROFILED_STATE:
+            setattr(ctx, attr, state[attr])
+        return True
+
+    def save_profile(self, ctx:SynthesisContext, cache_file:str):
+        """Save the profiled state to cache_file"""
+        state = {attr: getattr(ctx, attr) for attr in PROFILED_STATE}
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)))
+        os.replace(tmp_file, cache_file) # atomic, as other processes may read it
     
-    def static_analysis(self, src_file):
+    def static_analysis(self, ctx:SynthesisContext, src_file):
         """
         Statically analyze the source file to (1) get tag_var_name for each tag
         and (2) get all variables' values and stabibility information.
@@ -98,85 +369,130 @@ class Synthesizer:
         # get global/local information of each tag
         with open(src_file, "r") as f:
             code = f.read()
-        static_tags = re.findall(r'(Tag(\d+)\(\/\*(.*?):(\w+):(\w+):(\w+):(\w+)\*\/(.*?)\))', code)
-        self.tags = {}
-        self.scope_up = {} # key:val ==> child_scope:parent_scope
-        self.scope_down = {} # key:[val] ==> parent_scope:[child_scope(s)]
-        for tag_info in static_tags:
-            tag_str, tag_id, tag_type_str, scope_curr_id, scope_parent_id, stmt_id, tag_style, tag_var_name = tag_info[:]
+        ctx.tags = {}
+        ctx.scope_up = {} # key:val ==> child_scope:parent_scope
+        ctx.scope_down = {} # key:[val] ==> parent_scope:[child_scope(s)]
+        # locate all markers once so that add_tags() can splice the file in one pass
+        ctx.tag_spans = {}
+        ctx.tag_order = []
+        ctx.tag_pos = {}
+        ctx.scope_tree = {}
+        ctx.visible_scopes = {}
+        ctx.stmt_markers = {}
+        ctx.tag_def_spans = {}
+        for marker in re.finditer(r'\/\*(bef|aft)_stmt:(\d+)\*\/', code):
+            ctx.stmt_markers.setdefault((marker.group(1), int(marker.group(2))), []).append(marker.span())
+        for tag_def in re.finditer(r'#define Tag(\d+)\(x\) \(x\)', code):
+            ctx.tag_def_spans.setdefault(int(tag_def.group(1)), tag_def.span())
+        # locate the last header include, where function declarations are inserted
+        headers = re.findall(r'(#include.*)', code)
+        if len(headers) == 0:
+            ctx.header_end_loc = 0
+        else:
+            ctx.header_end_loc = code.index(headers[-1]) + len(headers[-1])
+        for static_tag in re.finditer(r'(Tag(\d+)\(\/\*(.*?):(\w+):(\w+):(\w+):(\w+)\*\/(.*?)\))', code):
+            tag_str, tag_id, tag_type_str, scope_curr_id, scope_parent_id, stmt_id, tag_style, tag_var_name = static_tag.groups()
             tag_id = int(tag_id)
             scope_curr_id = int(scope_curr_id)
             scope_parent_id = int(scope_parent_id)
-            assert tag_id not in self.tags
+            assert tag_id not in ctx.tags
             new_var = Var()
             new_var.scope_id = scope_curr_id
             new_var.is_constant = "const" in tag_type_str
             new_var.var_name = tag_var_name
-            new_var.var_type = strip_type_str(tag_type_str)
+            new_var.var_type = sys.intern(strip_type_str(tag_type_str))
             new_var.is_global = scope_curr_id == 0
 
             new_tag = Tag()
+            new_tag.tag_id = tag_id
             new_tag.tag_str = tag_str
             new_tag.is_statement = tag_style == 's'
             new_tag.tag_var = new_var
-            new_tag.tag_envs = []
             new_tag.statement_id = int(stmt_id)
-            self.tags[tag_id] = new_tag
+            ctx.tags[tag_id] = new_tag
+            ctx.tag_spans[tag_id] = static_tag.span()
+            ctx.tag_pos[tag_id] = len(ctx.tag_order)
+            ctx.tag_order.append(tag_id)
             #construct scope_up tree
-            if scope_curr_id not in self.scope_up:
-                self.scope_up[scope_curr_id] = scope_parent_id
+            if scope_curr_id not in ctx.scope_up:
+                ctx.scope_up[scope_curr_id] = scope_parent_id
             else:
-                assert self.scope_up[scope_curr_id] == scope_parent_id
+                assert ctx.scope_up[scope_curr_id] == scope_parent_id
+        # construct the scope tree and scope_down for constant-time visibility queries
+        ctx.scope_tree = build_scope_tree(ctx.scope_up)
+        for scope_id, node in ctx.scope_tree.items():
+            if node.children:
+                ctx.scope_down[scope_id] = [child.id for child in node.children]
     
-    def valid_scope(self, from_scope:int, to_scope:int) -> bool:
+    def get_visible_scopes(self, ctx:SynthesisContext, from_scope:int) -> set[int]:
+        """
+        All scopes accessible from from_scope, i.e., itself, the global scope and its ancestors.
+        This walks scope_up and is only used for scopes that the scope tree could not number.
+        """
+        if from_scope not in ctx.visible_scopes:
+            visible = {0, from_scope}
+            walked = {from_scope}
+            child_scope = from_scope
+            while True:
+                child_scope = ctx.scope_up[child_scope]
+                visible.add(child_scope)
+                if child_scope not in ctx.scope_up or child_scope == ctx.scope_up[child_scope] or child_scope in walked:
+                    break
+                walked.add(child_scope)
+            ctx.visible_scopes[from_scope] = visible
+        return ctx.visible_scopes[from_scope]
+
+    def valid_scope(self, ctx:SynthesisContext, from_scope:int, to_scope:int) -> bool:
         """Identify if we can access something in to_scope from from_scope"""
         if to_scope == 0: # global
             return True
         if from_scope == to_scope:
             return True
-        child_scope = from_scope
-        while True:
-            if self.scope_up[child_scope] == to_scope:
-                return True
-            child_scope = self.scope_up[child_scope]
-            if child_scope not in self.scope_up or child_scope == self.scope_up[child_scope]:
-                break
-        return False
+        from_node = ctx.scope_tree.get(from_scope)
+        if from_node is None or from_node.enter < 0: # not in the tree or in a loop of scope_up
+            return to_scope in self.get_visible_scopes(ctx, from_scope)
+        to_node = ctx.scope_tree.get(to_scope)
+        if to_node is None or to_node.enter < 0:
+            return False
+        return to_node.is_ancestor_of(from_node)
     
-    def get_envs(self, tag_id, env_num=1):
+    def get_envs(self, ctx:SynthesisContext, tag_id, env_num=1):
         """
         Get env vars for the given tag
         """
-        curr_scope_id = self.tags[tag_id].tag_var.scope_id
-        curr_tag_var_name = self.tags[tag_id].tag_var.var_name
-        tag_id_list = list(self.tags.keys())
-        tag_index = tag_id_list.index(tag_id)
+        curr_scope_id = ctx.tags[tag_id].tag_var.scope_id
+        curr_tag_var_name = ctx.tags[tag_id].tag_var.var_name
+        tag_index = ctx.tag_pos[tag_id]
         MAX_STEP = 20 # search backward or forward for MAX_STEP tags
         envs = []
-        env_vars = []
-        # for k in range(max(0, tag_index-MAX_STEP), min(len(tag_id_list), tag_index+MAX_STEP)): # search both upward and downward
+        env_vars = set()
+        # for k in range(max(0, tag_index-MAX_STEP), min(len(ctx.tag_order), tag_index+MAX_STEP)): # search both upward and downward
         for k in range(max(0, tag_index-MAX_STEP), tag_index): # search upward only to avoid use uninitialized variable
-            env_tag_id = tag_id_list[k]
-            if self.tags[env_tag_id].tag_var.var_name == curr_tag_var_name:
+            env_tag_id = ctx.tag_order[k]
+            env_var = ctx.tags[env_tag_id].tag_var
+            if env_var.var_name == curr_tag_var_name:
                 continue
             #FIXME: this is a work around to avoid using uninitialized i,j,k in csmith generated prgrams
-            if self.tags[env_tag_id].tag_var.var_name in ['i', 'j', 'k']:
+            if env_var.var_name in ['i', 'j', 'k']:
                 continue
-            if self.valid_scope(from_scope=curr_scope_id, to_scope=self.tags[env_tag_id].tag_var.scope_id):
-                if self.tags[env_tag_id].tag_var.var_name not in env_vars:
+            if self.valid_scope(ctx, from_scope=curr_scope_id, to_scope=env_var.scope_id):
+                if env_var.var_name not in env_vars:
                     envs.append(env_tag_id)
-                    env_vars.append(self.tags[env_tag_id].tag_var.var_name)
+                    env_vars.add(env_var.var_name)
         random.shuffle(envs)
         return envs[:env_num]
 
     def construct_tag_def(self, tag_id:int, var_types:list[str]) -> str:
         """Construct Tag definition"""
         return_type = var_types[0]
-        fmt_strs = ""
-        for var_ty in var_types:
-            fmt_strs += f':%"{VarType.get_format(VarType.from_str(var_ty))}"'
-        v_para_strs = ",".join([f'v{var_i}' for var_i in range(len(var_types))])
-        print_tag = f'printf("Tag{tag_id}{fmt_strs}\\n", {v_para_strs});'
+        if self.tag_channel == "binary":
+            print_tag = "".join([f'creal_tag_record({tag_id},{var_i},(int64_t)v{var_i});' for var_i in range(len(var_types))])
+        else:
+            fmt_strs = ""
+            for var_ty in var_types:
+                fmt_strs += f':%"{VarType.get_format(VarType.from_str(var_ty))}"'
+            v_para_strs = ",".join([f'v{var_i}' for var_i in range(len(var_types))])
+            print_tag = f'printf("Tag{tag_id}{fmt_strs}\\n", {v_para_strs});'
         var_defs = []
         count_defs = []
         last_defs = []
@@ -205,128 +521,223 @@ return v0; \
 }}'
         return tag_def
 
-    def add_tags(self, src_file):
+    def add_tags(self, ctx:SynthesisContext, src_file):
         """
-        Add Tags for later profiling
+        Add Tags for later profiling.
+        The markers located by static_analysis() are replaced in a single pass:
+        like a sequence of str.replace(..., 1), the k-th tag of a statement takes the k-th marker of that statement.
         """
         with open(src_file, 'r') as f:
             src = f.read()
-        for tag_id in self.tags:
-            envs = self.get_envs(tag_id, env_num=NUM_ENV)
+        edits = []
+        if self.tag_channel == "binary":
+            edits.append((0, 0, TAG_CHANNEL_PRELUDE)) # the Tag functions are defined at the start of the file
+        used_markers = {} # key:val ==> (bef|aft, stmt_id):number of markers taken
+        def take_marker(kind, stmt_id, new_str):
+            k = used_markers.get((kind, stmt_id), 0)
+            markers = ctx.stmt_markers.get((kind, stmt_id), [])
+            if k < len(markers):
+                edits.append((*markers[k], new_str))
+                used_markers[(kind, stmt_id)] = k + 1
+        for tag_id in ctx.tags:
+            envs = self.get_envs(ctx, tag_id, env_num=NUM_ENV)
             for env_id in envs:
-                self.tags[tag_id].tag_envs.append(deepcopy(self.tags[env_id].tag_var))
+                ctx.tags[tag_id].tag_envs.append(deepcopy(ctx.tags[env_id].tag_var))
             envs = [tag_id] + envs # add self as the first env
-            envs_str = ','.join([self.tags[env_id].tag_var.var_name if '*' not in self.tags[env_id].tag_var.var_name else '&({var})==0?{invalid}:{var}'.format(var=self.tags[env_id].tag_var.var_name, invalid=INVALID_TAG_VALUE) for env_id in envs])
+            envs_str = ','.join([ctx.tags[env_id].tag_var.var_name if '*' not in ctx.tags[env_id].tag_var.var_name else '&({var})==0?{invalid}:{var}'.format(var=ctx.tags[env_id].tag_var.var_name, invalid=INVALID_TAG_VALUE) for env_id in envs])
             # place TagBefore check Call
             bef_tag_call = f'/*bef*/Tag{tag_id}({envs_str});'
-            src = src.replace(f'/*bef_stmt:{self.tags[tag_id].statement_id}*/', bef_tag_call, 1)
-            self.tags[tag_id].tag_check_strs.append(bef_tag_call+"\n")
+            take_marker('bef', ctx.tags[tag_id].statement_id, bef_tag_call)
+            ctx.tags[tag_id].tag_check_strs.append(bef_tag_call+"\n")
             # place Tag call
             tag_call = f'/*tag*/Tag{tag_id}({envs_str})'
-            src = src.replace(self.tags[tag_id].tag_str, tag_call, 1)
+            edits.append((*ctx.tag_spans[tag_id], tag_call))
             # self.tags[tag_id].tag_str = tag_call
             # place TagAfter check Call
             aft_tag_call = f'/*aft*/Tag{tag_id}({envs_str});'
-            src = src.replace(f'/*aft_stmt:{self.tags[tag_id].statement_id}*/', aft_tag_call, 1)
-            self.tags[tag_id].tag_check_strs.append(aft_tag_call+"\n")
+            take_marker('aft', ctx.tags[tag_id].statement_id, aft_tag_call)
+            ctx.tags[tag_id].tag_check_strs.append(aft_tag_call+"\n")
             # replace Tag declaration
             var_types = []
             for env in envs:
-                var_types.append(self.tags[env].tag_var.var_type)
+                var_types.append(ctx.tags[env].tag_var.var_type)
             tag_defs = "\n" + self.construct_tag_def(tag_id, var_types)
-            src = src.replace(f"#define Tag{tag_id}(x) (x)", tag_defs, 1)
-            self.tags[tag_id].tag_check_strs.append(tag_defs + "\n")
+            if tag_id in ctx.tag_def_spans:
+                edits.append((*ctx.tag_def_spans[tag_id], tag_defs))
+            ctx.tags[tag_id].tag_check_strs.append(tag_defs + "\n")
         with open(src_file, 'w') as f:
-            f.write(src)
+            f.write(splice(src, edits))
 
 
-    def profiling(self, filename):
+    def profiling(self, ctx:SynthesisContext, filename):
         """
         Instrument file with profiler;
         Run and collect values.
         """
         # profiling
-        ret, _ = run_cmd(f"{PROFILER} {filename} -- -I{CSMITH_HOME}/include", DEBUG=self.DEBUG)
+        ret = self.run_profiler(ctx, filename)
         if ret != CMD.OK:
             raise SynthesizerError
         
-        # further synthesis will be based on self.src_syn instead of self.src to avoid heavy removal of useless tags after synthesis.
+        # further synthesis will be based on src_syn instead of src to avoid heavy removal of useless tags after synthesis.
         with open(filename, 'r') as f:
-            self.src_syn_orig = f.read()
+            ctx.src_syn_orig = f.read()
         
-        self.static_analysis(filename)
-        self.add_tags(filename)
+        self.static_analysis(ctx, filename)
+        self.add_tags(ctx, filename)
 
         with tempfile.NamedTemporaryFile(suffix=".out", delete=True) as tmp_f:
             tmp_f.close()
             exe_out = tmp_f.name
             # run with CC1
-            ret, _ = run_cmd(f"{CC1} -I{CSMITH_HOME}/include -w -O0 {filename} -o {exe_out}", DEBUG=self.DEBUG)
+            pch_flags = self.pch_cache.get_flags(f"{CC1} -w -O0") if self.pch_cache is not None else []
+            ret, _ = run_cmd(f"{CC1} -I{CSMITH_HOME}/include -w -O0 {' '.join(pch_flags + [filename])} -o {exe_out}", DEBUG=ctx.DEBUG)
+            if ret == CMD.Error and len(pch_flags) > 0:
+                ret, _ = run_cmd(f"{CC1} -I{CSMITH_HOME}/include -w -O0 {filename} -o {exe_out}", DEBUG=ctx.DEBUG)
+                if ret == CMD.OK:
+                    self.pch_cache.disable(f"{CC1} -w -O0")
             if ret != CMD.OK:
                 if os.path.exists(exe_out):
                     os.remove(exe_out)
                 raise SynthesizerError
-            ret, profile_out_1 = run_cmd(exe_out, timeout=3, DEBUG=self.DEBUG)
-            if ret != CMD.OK:
+            try:
+                self.collect_profile(ctx, exe_out)
+            finally:
                 os.remove(exe_out)
-                raise SynthesizerError
-            os.remove(exe_out)
+
+    def collect_profile(self, ctx:SynthesisContext, exe_out:str):
+        """
+        Run the profiled seed and collect tag values and their stability.
+        With the text channel, each record "TagN:tag_val:env_val..." is parsed as it is printed and the run
+        stops early once all tags are alive and all their variables are unstable, as later records cannot change anything.
+        With the binary channel, the records are read from the file written when the seed exits.
+        """
         env_re_str = ":".join([':?([-|\d]+)?']*(NUM_ENV)) #@FIXME: no need to have exact NUM_ENV env vars here, now a temp fix is shown below and thus env_re_str is useless.
 
-        raw_values_1 = [[item.split(':')[0].replace('Tag', '')]+[x for x in item.split(':')[1:] if x != ''] for item in profile_out_1.split() if 'Tag' in item]
-
-        if self.DEBUG:
-            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), f">>length of raw_values: {len(raw_values_1)}", flush=True)
-        # construct tags
-        self.alive_tags = []
-        # get values and check stability with raw_values_1
-        checked_tag_id = [] # all tag_id that have been checked. A tag's env is not stable if it has never been checked.
-        for i in range(len(raw_values_1)):
-            tag_info = raw_values_1[i]
-            curr_tag_id = int(tag_info[0])
-            curr_num_env = len(tag_info) - 2
-            curr_tag_var_value = int(tag_info[1])
-            curr_tag_env_value_list = [] if curr_num_env == 0 else list(map(int, tag_info[2:]))
+        ctx.alive_tags = []
+        alive_tags = set()
+        checked_tag_id = set() # all tag_id that have been checked. A tag's env is not stable if it has never been checked.
+        undecided_tags = set(ctx.tags) # tags whose stability may still change
+        num_values = 0
+
+        def update_tag(curr_tag_id:int, curr_tag_var_value:int, curr_tag_env_value_list:list[int]):
+            """Update the values and stability of a tag and its envs with one record"""
+            nonlocal num_values
+            num_values += 1
+            curr_num_env = len(curr_tag_env_value_list)
+            curr_tag = ctx.tags[curr_tag_id]
             # Test the stability of the tag_var
-            if hasattr(self.tags[curr_tag_id].tag_var, "var_value"):
-                if curr_tag_var_value != self.tags[curr_tag_id].tag_var.var_value:
-                    self.tags[curr_tag_id].tag_var.is_stable = False
+            if hasattr(curr_tag.tag_var, "var_value"):
+                if curr_tag_var_value != curr_tag.tag_var.var_value:
+                    curr_tag.tag_var.is_stable = False
             else:
-                self.tags[curr_tag_id].tag_var.var_value = curr_tag_var_value
+                curr_tag.tag_var.var_value = curr_tag_var_value
             if curr_tag_var_value == INVALID_TAG_VALUE: # invalid tag value because of null pointer. should only in env vars
-                self.tags[curr_tag_id].tag_var.is_stable = False
+                curr_tag.tag_var.is_stable = False
             # Test the stability of each env var
             for env_i in range(curr_num_env):
-                if hasattr(self.tags[curr_tag_id].tag_envs[env_i], "var_value"):
-                    if curr_tag_env_value_list[env_i] != self.tags[curr_tag_id].tag_envs[env_i].var_value:
-                        self.tags[curr_tag_id].tag_envs[env_i].is_stable = False
-                    checked_tag_id.append(curr_tag_id) # if we are not assigning the value for the first time, the value is now checked.
+                if hasattr(curr_tag.tag_envs[env_i], "var_value"):
+                    if curr_tag_env_value_list[env_i] != curr_tag.tag_envs[env_i].var_value:
+                        curr_tag.tag_envs[env_i].is_stable = False
+                    checked_tag_id.add(curr_tag_id) # if we are not assigning the value for the first time, the value is now checked.
                 else:
-                    self.tags[curr_tag_id].tag_envs[env_i].var_value =curr_tag_env_value_list[env_i]
+                    curr_tag.tag_envs[env_i].var_value = curr_tag_env_value_list[env_i]
                 if curr_tag_env_value_list[env_i] == INVALID_TAG_VALUE: # invalid tag value because of null pointer. should only in env vars
-                    self.tags[curr_tag_id].tag_envs[env_i].is_stable = False
-            if curr_tag_id not in self.alive_tags:
-                self.alive_tags.append(curr_tag_id)
+                    curr_tag.tag_envs[env_i].is_stable = False
+            if curr_tag_id not in alive_tags:
+                alive_tags.add(curr_tag_id)
+                ctx.alive_tags.append(curr_tag_id)
+            if curr_tag_id in undecided_tags and not curr_tag.tag_var.is_stable and not any(env.is_stable for env in curr_tag.tag_envs):
+                undecided_tags.discard(curr_tag_id)
+
+        if ctx.DEBUG:
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">>run_cmd: \n", exe_out, flush=True)
+        if self.tag_channel == "binary":
+            self.collect_binary_channel(ctx, exe_out, update_tag)
+        else:
+            decided = False
+            timed_out = threading.Event()
+            def kill_on_timeout():
+                timed_out.set()
+                process.kill()
+            with sp.Popen([exe_out], stdout=sp.PIPE, stderr=sp.DEVNULL, encoding="utf-8") as process:
+                watchdog = threading.Timer(PROFILE_TIMEOUT, kill_on_timeout)
+                watchdog.start()
+                try:
+                    for line in process.stdout:
+                        for item in line.split():
+                            if 'Tag' not in item:
+                                continue
+                            fields = item.split(':')
+                            tag_info = [fields[0].replace('Tag', '')] + [x for x in fields[1:] if x != '']
+                            update_tag(int(tag_info[0]), int(tag_info[1]), list(map(int, tag_info[2:])))
+                        if len(undecided_tags) == 0:
+                            decided = True
+                            break
+                    if not decided:
+                        process.wait()
+                finally:
+                    watchdog.cancel()
+                    if process.poll() is None:
+                        process.kill()
+            if not decided and (timed_out.is_set() or process.returncode != 0):
+                raise SynthesizerError
+        if ctx.DEBUG:
+            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), f">>length of raw_values: {num_values}", flush=True)
         # all tag_id that have been checked. A tag's env is not stable if it has never been checked.
-        for tag_id in self.alive_tags:
+        for tag_id in ctx.alive_tags:
             if tag_id not in checked_tag_id:
-                for env_i in range(len(self.tags[tag_id].tag_envs)):
-                    self.tags[tag_id].tag_envs[env_i].is_stable = False
-
-
-    def remove_valuetag(self):
+                for env_i in range(len(ctx.tags[tag_id].tag_envs)):
+                    ctx.tags[tag_id].tag_envs[env_i].is_stable = False
+
+    def collect_binary_channel(self, ctx:SynthesisContext, exe_out:str, update_tag):
+        """Run the profiled seed with the binary tag channel and pass each record to update_tag"""
+        with tempfile.NamedTemporaryFile(suffix=".tags", delete=False) as tmp_f:
+            channel_file = tmp_f.name
+        try:
+            try:
+                process = sp.run([exe_out], stdout=sp.DEVNULL, stderr=sp.DEVNULL, timeout=PROFILE_TIMEOUT, env={**os.environ, TAG_CHANNEL_ENV: channel_file})
+            except sp.TimeoutExpired:
+                raise SynthesizerError
+            if process.returncode != 0:
+                raise SynthesizerError
+            records = read_tag_channel(channel_file)
+        finally:
+            os.remove(channel_file)
+        # values are recorded as int64_t; restore uint64_t values above INT64_MAX
+        is_uint64 = {}
+        def fix_value(tag_id:int, idx:int, val:int) -> int:
+            if val >= 0:
+                return val
+            if (tag_id, idx) not in is_uint64:
+                var = ctx.tags[tag_id].tag_var if idx == 0 else ctx.tags[tag_id].tag_envs[idx-1]
+                is_uint64[(tag_id, idx)] = VarType.from_str(var.var_type) == VarType.UINT64
+            return val + (1 << 64) if is_uint64[(tag_id, idx)] else val
+        # the records of a Tag call are consecutive, starting with idx 0 for the tag_var
+        values = []
+        for tag_id, idx, val in records:
+            if idx == 0 and len(values) > 0:
+                update_tag(curr_tag_id, values[0], values[1:])
+                values = []
+            curr_tag_id = tag_id
+            values.append(fix_value(tag_id, idx, val))
+        if len(values) > 0:
+            update_tag(curr_tag_id, values[0], values[1:])
+
+
+    def remove_valuetag(self, ctx:SynthesisContext):
         """
         Remove a ValueTag from source file
         """
-        for tag_id in self.tags:
-            self.src = self.src.replace(f"#define Tag{tag_id}(x) (x)\n", "")
-            if self.tags[tag_id].is_statement:
-                self.src = self.src.replace(self.tags[tag_id].tag_str, '')
+        for tag_id in ctx.tags:
+            ctx.src = ctx.src.replace(f"#define Tag{tag_id}(x) (x)\n", "")
+            if ctx.tags[tag_id].is_statement:
+                ctx.src = ctx.src.replace(ctx.tags[tag_id].tag_str, '')
             else:
-                self.src =self.src.replace(self.tags[tag_id].tag_str, self.tags[tag_id].tag_var.var_name)
-            for tag_check_str in self.tags[tag_id].tag_check_strs:
-                self.src = self.src.replace(tag_check_str, '')
-        self.src = re.sub(r'[\w|_|\s|*]+ Tag\d+\(.*\)\{.*\}\n', '', self.src)
+                ctx.src =ctx.src.replace(ctx.tags[tag_id].tag_str, ctx.tags[tag_id].tag_var.var_name)
+            for tag_check_str in ctx.tags[tag_id].tag_check_strs:
+                ctx.src = ctx.src.replace(tag_check_str, '')
+        ctx.src = re.sub(r'[\w|_|\s|*]+ Tag\d+\(.*\)\{.*\}\n', '', ctx.src)
     
     def ignore_typedef(self, _typedef:str) -> bool:
         ignored_typedef = [
@@ -337,20 +748,14 @@ return v0; \
                 return True
         return False
 
-    def insert_func_decl(self, func_id_list):
-        # locate the last header include
-        headers = re.findall(r'(#include.*)', self.src_syn)
-        if len(headers) == 0:
-            header_end_loc = 0
-        else:
-            header_end_loc = self.src_syn.index(headers[-1]) + len(headers[-1])
-        # insert the function declaration 
+    def insert_func_decl(self, ctx:SynthesisContext, func_id_list):
+        # insert the function declaration after the last header include, in order
+        header_end_loc = ctx.header_end_loc
         for func_id in list(set(func_id_list)):
             for misc in self.functionDB[func_id].misc:
                 if not self.ignore_typedef(misc):
                     misc = "\n" + misc + "\n"
-                    self.src_syn = self.src_syn[:header_end_loc] + misc + self.src_syn[header_end_loc:]
-                    header_end_loc += len(misc)
+                    ctx.syn_edits.append((header_end_loc, header_end_loc, misc))
 
             function_body = self.functionDB[func_id].function_body
             #FIXME: the added attribute may be incompatible with existing function attributes from the database. Can use this feature again if attributes are removed from the database.
@@ -358,8 +763,7 @@ return v0; \
             # if prob_attr > 50:
             #     function_body = "inline __attribute__((always_inline))\n" + function_body
             function_body = "\n" + function_body + "\n"
-            self.src_syn = self.src_syn[:header_end_loc] + function_body + self.src_syn[header_end_loc:]
-            header_end_loc += len(function_body)
+            ctx.syn_edits.append((header_end_loc, header_end_loc, function_body))
         
     def synthesize_input(self, env_vars:list[Var], func_inp_list:list[str], func_inp_types:list[VarType]):
         """Synthesize input to the target function call with environmental variables"""
@@ -368,7 +772,7 @@ return v0; \
             inp_value = int(func_inp_list[inp_i])
             if len(env_vars) > 0:
                 env = random.choice(env_vars)
-                env_value_cast = VarType.get_ctypes(func_inp_types[inp_i], env.var_value).value
+                env_value_cast = VarType.wrap(func_inp_types[inp_i], env.var_value)
                 if abs(env_value_cast) > MAX_CONST_CCOMP:
                     new_inp_list.append(f"{inp_value}")
                 else:
@@ -388,8 +792,8 @@ return v0; \
         if not (ret_val_min <= func_out <= ret_val_max):
             output_str += f'-({func_out})'
             output = 0
-        for env in env_vars:
-            env_value_cast = VarType.get_ctypes(func_return_type, env.var_value).value
+        env_values_cast = VarType.wrap_list(func_return_type, [env.var_value for env in env_vars])
+        for env, env_value_cast in zip(env_vars, env_values_cast):
             if abs(env_value_cast) > MAX_CONST_CCOMP or abs(env_value_cast+output) > MAX_CONST_CCOMP:
                 continue
             if ret_val_min <= env_value_cast+output <= ret_val_max:
@@ -399,15 +803,15 @@ return v0; \
                 output_str += f'+(({VarType.to_str(func_return_type)})({env.var_name})-({env_value_cast}))'
         return output_str, output
 
-    def replace_valuetag_with_func(self, tag_id:int, tgt_func_idx:int):
+    def replace_valuetag_with_func(self, ctx:SynthesisContext, tag_id:int, tgt_func_idx:int):
         """
         Replace a ValueTag with the selected function call
         """
         # use stable tag_var and env_vars for synthesis
         stable_env_vars = []
-        if self.tags[tag_id].tag_var.is_stable:
-            stable_env_vars.append(self.tags[tag_id].tag_var)
-        for env in self.tags[tag_id].tag_envs:
+        if ctx.tags[tag_id].tag_var.is_stable:
+            stable_env_vars.append(ctx.tags[tag_id].tag_var)
+        for env in ctx.tags[tag_id].tag_envs:
             if env.is_stable:
                 stable_env_vars.append(env)
 
@@ -417,13 +821,13 @@ return v0; \
         new_output_str, new_output = self.synthesize_output(stable_env_vars, func_out, self.functionDB[tgt_func_idx].return_type)
         
         # synthesize func_call for expr, make sure to restore the value of the expr
-        if not self.tags[tag_id].is_statement:
+        if not ctx.tags[tag_id].is_statement:
             func_call = "(({tag_type})({call_name}({input}){output})+{tag_var_value})".format(
-                tag_type=self.tags[tag_id].tag_var.var_type, 
+                tag_type=ctx.tags[tag_id].tag_var.var_type, 
                 call_name=self.functionDB[tgt_func_idx].call_name, 
                 input=", ".join(new_input_str), 
                 output=f"{new_output_str}-({new_output})",
-                tag_var_value=self.tags[tag_id].tag_var.var_name,
+                tag_var_value=ctx.tags[tag_id].tag_var.var_name,
             )
         # for statement tag, we also want to assign the function call to a stable env variable
         else:
@@ -433,77 +837,85 @@ return v0; \
                 output=new_output_str
             )
             restore_env = None
-            if not self.tags[tag_id].tag_var.is_constant:
-                restore_env = self.tags[tag_id].tag_var
+            if not ctx.tags[tag_id].tag_var.is_constant:
+                restore_env = ctx.tags[tag_id].tag_var
             elif len(stable_env_vars) > 0:
                 restore_env = random.choice(stable_env_vars)
             if restore_env is not None and not restore_env.is_constant:
                 func_call = f'{restore_env.var_name} = ({restore_env.var_type})({func_call}-({new_output}))+({restore_env.var_value});'
 
         # insert the function call
-        self.src_syn = self.src_syn.replace(self.tags[tag_id].tag_str, f'/*TAG{tag_id}:STA*/' + func_call + f'/*TAG{tag_id}:END:{self.tags[tag_id].tag_var.var_name}*/')
+        ctx.syn_edits.append((*ctx.tag_spans[tag_id], f'/*TAG{tag_id}:STA*/' + func_call + f'/*TAG{tag_id}:END:{ctx.tags[tag_id].tag_var.var_name}*/'))
 
 
     def synthesizer(self, src_filename:str, num_mutant:int=1, DEBUG:bool=False):
         """
         Synthesize a source file by replacing variables/constants with function calls.
+        The mutants are saved next to src_filename, return their filenames.
         """
-        self.tags = {} # all tags information
-        self.vars = {} # all variale information
-        self.tag_id_list = [] # tag_id in a sequential order as appeared in the execution
-        self.scope_up = {} # key:val ==> child_scope:parent_scope
-        self.scope_down = {} # key:[val] ==> parent_scope:[child_scope(s)]
-        self.alive_tags = [] # all alive tag id
+        all_syn_files = []
+        for num_i, syn_src in enumerate(self.synthesize_iter(src_filename, num_mutant=num_mutant, DEBUG=DEBUG)):
+            dst_filename = f'{os.path.splitext(src_filename)[0]}_syn{num_i}.c'
+            with open(dst_filename, "w") as f:
+                f.write(syn_src)
+            all_syn_files.append(dst_filename)
+        return all_syn_files
 
-        self.DEBUG = DEBUG
+    def synthesize_iter(self, src_filename:str, num_mutant:int=1, DEBUG:bool=False):
+        """
+        Synthesize a source file by replacing variables/constants with function calls.
+        Yield the source code of each mutant as soon as it is synthesized; nothing is written to disk.
+        All the state of this seed is kept in its own SynthesisContext, so concurrent calls are safe.
+        """
+        ctx = SynthesisContext(DEBUG=DEBUG)
         assert num_mutant >= 1
-        # backup src file
-        tmp_f = tempfile.NamedTemporaryFile(suffix=".c", delete=False)
-        tmp_f.close
-        shutil.copy(src_filename, tmp_f.name)
-        # insert ValueTag
-        if self.DEBUG:
-            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">profiling start", flush=True)
-        self.profiling(tmp_f.name)
-        if self.DEBUG:
-            print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">profiling end", flush=True)
-        with open(tmp_f.name, "r") as f:
-            self.src_orig = f.read()
-        os.remove(tmp_f.name)
+        profile_cache_file = self.get_profile_cache_file(src_filename)
+        if profile_cache_file is not None and self.load_profile(ctx, profile_cache_file):
+            if ctx.DEBUG:
+                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">profile loaded from", profile_cache_file, flush=True)
+        else:
+            # backup src file
+            tmp_f = tempfile.NamedTemporaryFile(suffix=".c", delete=False)
+            tmp_f.close
+            shutil.copy(src_filename, tmp_f.name)
+            # insert ValueTag
+            if ctx.DEBUG:
+                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">profiling start", flush=True)
+            self.profiling(ctx, tmp_f.name)
+            if ctx.DEBUG:
+                print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">profiling end", flush=True)
+            with open(tmp_f.name, "r") as f:
+                ctx.src_orig = f.read()
+            os.remove(tmp_f.name)
+            if profile_cache_file is not None:
+                self.save_profile(ctx, profile_cache_file)
         # sythesis
-        all_syn_files = []
-        if len(self.alive_tags) == 0:
-            return all_syn_files
+        if len(ctx.alive_tags) == 0:
+            return
         for num_i in range(num_mutant):
-            if self.DEBUG:
+            if ctx.DEBUG:
                 print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">synthesize mutatant start", num_i, flush=True)
-            self.src = copy(self.src_orig)
-            self.src_syn = copy(self.src_syn_orig)
+            ctx.src = copy(ctx.src_orig)
+            ctx.syn_edits = []
             replaced_valuetag = []
             inserted_func_ids = []
-            for tag_id in self.alive_tags:
+            for tag_id in ctx.alive_tags:
                 # randomly decide if we want to replace this value
                 if tag_id in replaced_valuetag or random.randint(0, 100) > self.prob:
                     continue #skip this value
-                # randomly select a function from database
-                while True:
-                    tgt_func_idx = random.randint(0, len(self.functionDB)-1)
-                    if self.functionDB[tgt_func_idx].has_io:
-                        break
+                # randomly select a function with IO from database
+                tgt_func_idx = self.functionDB.sample()
                 # replace the ValueTag with the selected function
-                self.replace_valuetag_with_func(tag_id, tgt_func_idx)
+                self.replace_valuetag_with_func(ctx, tag_id, tgt_func_idx)
                 replaced_valuetag.append(tag_id)
                 inserted_func_ids.append(tgt_func_idx)
-            # self.remove_valuetag() # we don't do this now because this removal is too costly and it has no impact on the semantics of the synthesized program.
-            self.insert_func_decl(inserted_func_ids)
-            dst_filename = f'{os.path.splitext(src_filename)[0]}_syn{num_i}.c'
-            with open(dst_filename, "w") as f:
-                f.write(self.src_syn)
-            all_syn_files.append(dst_filename)
-            if self.DEBUG:
+            # self.remove_valuetag(ctx) # we don't do this now because this removal is too costly and it has no impact on the semantics of the synthesized program.
+            self.insert_func_decl(ctx, inserted_func_ids)
+            # assemble the mutant from the profiled seed in one pass
+            ctx.src_syn = splice(ctx.src_syn_orig, ctx.syn_edits)
+            if ctx.DEBUG:
                 print(datetime.now().strftime("%d/%m/%Y %H:%M:%S"), ">synthesize mutatant end", num_i, flush=True)
-
-        return all_syn_files
+            yield ctx.src_syn
 
 
 class SynthesizerError(Exception):
@@ -36,7 +36,7 @@ class CComp:
 
     def check_program(
         self, program: SourceProgram, timeout: int | None = None, debug: bool = False,
-        additional_flags: list[str] = [],
+        additional_flags: list[str] = [], tmp_dir: Path | None = None,
     ) -> bool:
         """Checks the input program for errors using ccomp's interpreter mode.
 
@@ -44,6 +44,8 @@ class CComp:
            program (SourceProgram): the input program
            timeout (int | None): timeout in seconds for the checking
            debug (bool): if true ccomp's output will be printed on failure
+           additional_flags (list[str]): extra flags passed to ccomp
+           tmp_dir (Path | None): TMPDIR of ccomp, the default temporary directory if None
 
         Returns:
             bool:
@@ -72,7 +74,7 @@ class CComp:
         try:
             result = run_cmd(
                 cmd,
-                additional_env={"TMPDIR": str(tempfile.gettempdir())},
+                additional_env={"TMPDIR": str(tmp_dir if tmp_dir is not None else tempfile.gettempdir())},
                 timeout=timeout,
             )
         except subprocess.CalledProcessError as e:
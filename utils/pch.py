@@ -0,0 +1,109 @@
+import os, shutil, hashlib, tempfile, threading
+import subprocess as sp
+from pathlib import Path
+
+
+class PCHCache:
+    """Precompiled csmith.h headers, one per (compiler, flags) pair.
+
+    A header is built under cache_dir on first use and checked with a test compile.
+    get_flags() returns the flags that make a compile use it, or an empty list if
+    the compiler cannot use a precompiled header, in which case nothing changes.
+    gcc takes `-include <dir>/csmith.h` and picks up the csmith.h.gch next to it;
+    clang takes `-include-pch <dir>/csmith.h.pch`.
+    """
+
+    HEADER = "csmith.h"
+    TEST_PROGRAM = '#include "csmith.h"\nint main(void) { return 0; }\n'
+
+    def __init__(self, cache_dir: Path, include_dir: Path, timeout: int = 60) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.include_dir = Path(include_dir)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.flags = {} # key:val ==> compiler:flags, [] if no precompiled header can be used
+
+    @staticmethod
+    def get_family(compiler: str) -> str | None:
+        """gcc or clang, None for compilers without a supported precompiled header format"""
+        name = os.path.basename(compiler.split()[0])
+        if "clang" in name:
+            return "clang"
+        if "gcc" in name or name in ["cc", "c99"]:
+            return "gcc"
+        return None
+
+    def get_key(self, compiler: str) -> str:
+        """Identify the compiler command, its binary and the header"""
+        exe = shutil.which(compiler.split()[0])
+        parts = [compiler, str(self.include_dir)]
+        for path in [exe, self.include_dir / PCHCache.HEADER]:
+            if path is not None and os.path.exists(path):
+                stat = os.stat(path)
+                parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
+
+    def run(self, cmd: list[str]) -> bool:
+        try:
+            return sp.run(cmd, timeout=self.timeout, capture_output=True).returncode == 0
+        except (sp.TimeoutExpired, OSError): # e.g., the compiler does not exist
+            return False
+
+    def build(self, compiler: str, family: str, pch_dir: Path) -> bool:
+        """Build the precompiled header of compiler into pch_dir, atomically"""
+        if pch_dir.exists():
+            return True
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.cache_dir, prefix=f"{pch_dir.name}."))
+        header = self.include_dir / PCHCache.HEADER
+        if family == "gcc":
+            # gcc looks for csmith.h.gch next to the -include'd csmith.h and falls back to the header itself
+            shutil.copy(header, tmp_dir / PCHCache.HEADER)
+            output = tmp_dir / f"{PCHCache.HEADER}.gch"
+        else:
+            # clang records the path of the header, so it is built from the original one
+            output = tmp_dir / f"{PCHCache.HEADER}.pch"
+        try:
+            ok = self.run(compiler.split() + [f"-I{self.include_dir}", "-x", "c-header", str(header), "-o", str(output)])
+            if ok:
+                try:
+                    os.rename(tmp_dir, pch_dir)
+                except OSError: # built by another process in the meantime
+                    pass
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return ok
+
+    def verify(self, compiler: str, flags: list[str]) -> bool:
+        """Compile a test program with the precompiled header"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src = os.path.join(tmp_dir, "test.c")
+            with open(src, "w") as f:
+                f.write(PCHCache.TEST_PROGRAM)
+            # make gcc fail instead of silently ignoring an unusable header
+            extra = ["-Winvalid-pch", "-Werror=invalid-pch"] if PCHCache.get_family(compiler) == "gcc" else []
+            return self.run(compiler.split() + flags + extra + [f"-I{self.include_dir}", "-c", src, "-o", os.path.join(tmp_dir, "test.o")])
+
+    def get_flags(self, compiler: str) -> list[str]:
+        """The flags that make compiler use the precompiled header, built and checked on first use"""
+        with self.lock:
+            if compiler in self.flags:
+                return self.flags[compiler]
+            flags = []
+            family = PCHCache.get_family(compiler)
+            if family is not None:
+                pch_dir = self.cache_dir / self.get_key(compiler)
+                if self.build(compiler, family, pch_dir):
+                    if family == "gcc":
+                        flags = ["-include", str(pch_dir / PCHCache.HEADER)]
+                    else:
+                        flags = ["-include-pch", str(pch_dir / f"{PCHCache.HEADER}.pch")]
+                    if not self.verify(compiler, flags):
+                        flags = []
+            self.flags[compiler] = flags
+            return flags
+
+    def disable(self, compiler: str) -> None:
+        """Stop using the precompiled header of compiler, e.g., after a compile failed with it"""
+        with self.lock:
+            self.flags[compiler] = []
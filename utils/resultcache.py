@@ -0,0 +1,101 @@
+import os, json, time, shutil, sqlite3, hashlib, threading
+from pathlib import Path
+
+
+class ResultCache:
+    """A persistent, content-addressed cache of compilation and execution results.
+
+    Entries are stored in a SQLite database under cache_dir so that all processes of a
+    campaign can share them. The total size is bounded by max_bytes; the least recently
+    used entries, to within TOUCH_INTERVAL, are evicted first.
+    """
+
+    EVICT_INTERVAL = 64 # check the total size after this many insertions
+    EVICT_RATIO = 0.9   # evict down to this ratio of max_bytes
+    TOUCH_INTERVAL = 600 # refresh the last access of a hit only if it is older than this many seconds
+
+    def __init__(self, cache_dir: Path, max_bytes: int = 1 << 30) -> None:
+        cache_dir = Path(cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_file = cache_dir / "results.sqlite"
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.num_puts = 0
+        self.hits = 0
+        self.misses = 0
+        conn = self.connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash the parts of a key, e.g., (source hash, compiler command, flags, timeout class)"""
+        return hashlib.sha256("\0".join(map(str, parts)).encode()).hexdigest()
+
+    @staticmethod
+    def tool_id(tool) -> str:
+        """Identify the binary of a tool, e.g., a compiler command such as "gcc -O2" or a path,
+        by its resolved path, size and mtime, so that the results of a rebuilt or upgraded tool are not reused"""
+        if tool is None:
+            return ""
+        exe = shutil.which(str(tool).split()[0])
+        if exe is None:
+            return str(tool)
+        exe = os.path.realpath(exe)
+        stat = os.stat(exe)
+        return f"{exe}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def connect(self) -> sqlite3.Connection:
+        """One connection per thread and process, as sqlite connections must not cross either"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=60, isolation_level=None)
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        """Return the cached value of key or None"""
+        conn = self.connect()
+        row = conn.execute("SELECT value, last_access FROM results WHERE key=?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # hits are read-only most of the time, so that the processes sharing the cache do not queue for the write lock
+        now = time.time()
+        if now - row[1] >= ResultCache.TOUCH_INTERVAL:
+            conn.execute("UPDATE results SET last_access=? WHERE key=?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        """Cache value under key"""
+        value_str = json.dumps(value)
+        conn = self.connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO results(key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, value_str, len(key) + len(value_str), time.time()),
+        )
+        self.num_puts += 1
+        if self.num_puts % ResultCache.EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in max_bytes"""
+        conn = self.connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_free = total - int(self.max_bytes * ResultCache.EVICT_RATIO)
+        freed = 0
+        evicted = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_access").fetchall():
+            if freed >= to_free:
+                break
+            evicted.append((key,))
+            freed += size
+        conn.executemany("DELETE FROM results WHERE key=?", evicted)